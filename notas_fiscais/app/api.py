@@ -1,9 +1,17 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, status
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from app.query import query_data, QueryResult
+from app.data_export import FORMATS, iter_export, prepare_export
+from app.profiling import get_profile_file, list_profiles, run_profiled
 from app.run_etl import run_etl_pipeline
-from app.config import INPUT_DIR, TEMP_DIR  # Importar TEMP_DIR para limpeza
+from app.config import INPUT_DIR, LLM_SELF_BENCHMARK, get_db_path
 from app.logger import logger
 import os
+import sqlite3
+import tempfile
+import threading
 
 app = FastAPI(
     title="API de Notas Fiscais com Agentes de IA",
@@ -11,28 +19,72 @@ app = FastAPI(
     description="API para upload de dados de notas fiscais (ZIP) e consulta em linguagem natural usando agentes de IA.",
 )
 
+@app.on_event("startup")
+def start_llm_self_benchmark():
+    """Se LLM_SELF_BENCHMARK estiver definido, mede tokens/s de cada configuração em segundo plano e registra no log."""
+    if LLM_SELF_BENCHMARK:
+        from app.llm_backends import run_self_benchmark
+        threading.Thread(target=run_self_benchmark, args=(LLM_SELF_BENCHMARK,), daemon=True,
+                         name="llm-self-benchmark").start()
+
+
+def _validate_dataset(dataset: str) -> None:
+    """Rejeita identificadores de dataset inválidos com HTTP 400."""
+    try:
+        get_db_path(dataset)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _profile_requested(profile: bool, x_profile: str) -> bool:
+    """Perfil sob demanda: parâmetro `profile=true` ou cabeçalho `X-Profile: 1`."""
+    return profile or (x_profile or "").lower() in ("1", "true", "yes", "on")
+
+
+def _profile_info(profile_id: str):
+    """Identificador e URL dos arquivos do perfil gravado (None se a execução não foi perfilada)."""
+    if profile_id is None:
+        return None
+    return {"id": profile_id, "url": f"/diagnostics/profiles/{profile_id}/"}
+
+
 @app.post("/upload-and-process/", status_code=status.HTTP_200_OK)
-async def upload_and_process_file(file: UploadFile = File(...)):
-    """Faz upload de um arquivo .zip e o processa via pipeline ETL."""
-    logger.info(f"Upload recebido: {file.filename}")
+async def upload_and_process_file(file: UploadFile = File(...), dataset: str = None, profile: bool = False,
+                                  x_profile: str = Header(default=None)):
+    """
+    Faz upload de um arquivo .zip e o processa via pipeline ETL no dataset/cliente informado.
+    Com `profile=true` (ou cabeçalho `X-Profile: 1`), grava um perfil de CPU e memória do processamento.
+    """
+    logger.info(f"Upload recebido: {file.filename} (dataset: {dataset or 'padrão'})")
 
     if not file.filename.endswith(".zip"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Apenas arquivos .zip são permitidos.")
+    _validate_dataset(dataset)
 
-    # Salva o arquivo temporariamente em INPUT_DIR para que run_etl_pipeline possa acessá-lo
-    file_path = INPUT_DIR / file.filename
+    # Salva o arquivo temporariamente em INPUT_DIR com nome único, para que uploads simultâneos
+    # (inclusive de datasets diferentes com o mesmo nome de arquivo) não se sobrescrevam. O nome começa
+    # com "." para que o serviço de ingestão (app/watcher.py) não processe o arquivo uma segunda vez.
+    fd, temp_name = tempfile.mkstemp(prefix=".upload_", suffix=".zip", dir=INPUT_DIR)
+    file_path = INPUT_DIR / os.path.basename(temp_name)
     try:
         # Abre o arquivo em modo de escrita binária e escreve o conteúdo do upload
-        with open(file_path, "wb") as f:
+        with os.fdopen(fd, "wb") as f:
             f.write(await file.read())
         logger.info(f"Arquivo '{file.filename}' salvo temporariamente em '{file_path}'.")
 
-        # Executa o pipeline ETL com o nome do arquivo ZIP
-        success = run_etl_pipeline(file.filename)
+        # Executa o pipeline ETL fora do event loop, para que cargas de datasets diferentes rodem em paralelo
+        profile_id = None
+        if _profile_requested(profile, x_profile):
+            # O perfil é ligado na própria thread do pool que executa o pipeline
+            success, profile_id = await run_in_threadpool(
+                run_profiled, "etl", file.filename, run_etl_pipeline, file_path.name, dataset)
+        else:
+            success = await run_in_threadpool(run_etl_pipeline, file_path.name, dataset)
 
         if success:
             logger.info(f"Processamento de {file.filename} concluído.")
-            return {"status": "success", "message": f"Arquivo '{file.filename}' processado e dados salvos com sucesso."}
+            return {"status": "success", "message": f"Arquivo '{file.filename}' processado e dados salvos com sucesso.",
+                    "profile": _profile_info(profile_id)}
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -47,24 +99,25 @@ async def upload_and_process_file(file: UploadFile = File(...)):
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
-                logger.info(f"Arquivo temporário '{file.filename}' removido.")
+                logger.info(f"Arquivo temporário '{file_path.name}' removido.")
             except OSError as e:
-                logger.warning(f"Não foi possível remover arquivo temporário '{file.filename}': {e}")
-        # Limpar também o diretório TEMP_DIR, que é usado pela extração
-        for temp_file in TEMP_DIR.glob("*"):
-            if temp_file.is_file():
-                try:
-                    temp_file.unlink()
-                except OSError as e:
-                    logger.warning(f"Não foi possível remover arquivo temp de extração '{temp_file.name}': {e}")
+                logger.warning(f"Não foi possível remover arquivo temporário '{file_path.name}': {e}")
 
 
 @app.get("/query/", status_code=status.HTTP_200_OK)
-def query(question: str):
-    """Endpoint para enviar uma pergunta em linguagem natural ao agente de IA."""
-    logger.info(f"Consulta API recebida: '{question}'")
+def query(question: str, dataset: str = None, profile: bool = False, x_profile: str = Header(default=None)):
+    """
+    Endpoint para enviar uma pergunta em linguagem natural ao agente de IA, restrita ao dataset/cliente informado.
+    Com `profile=true` (ou cabeçalho `X-Profile: 1`), grava um perfil de CPU e memória da consulta.
+    """
+    logger.info(f"Consulta API recebida: '{question}' (dataset: {dataset or 'padrão'})")
+    _validate_dataset(dataset)
 
-    result: QueryResult = query_data(question)
+    profile_id = None
+    if _profile_requested(profile, x_profile):
+        result, profile_id = run_profiled("query", question, query_data, question, dataset)
+    else:
+        result: QueryResult = query_data(question, dataset)
 
     if result.status.startswith("success") or result.status == "warning":
         # Converter DataFrame para lista de dicionários para JSON response
@@ -72,8 +125,80 @@ def query(question: str):
         return {
             "data": response_data,
             "status": result.status,
-            "message": result.message
+            "message": result.message,
+            "stats": result.stats,  # Iterações do agente e tokens gastos na pergunta
+            "profile": _profile_info(profile_id),
         }
     else:
         # Se o status for "error", retorna um erro HTTP 500
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result.message)
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result.message)
+
+def _split_names(value: str):
+    """Converte 'a, b,c' em ['a', 'b', 'c'] (None se vazio)."""
+    return [name.strip() for name in value.split(",") if name.strip()] if value else None
+
+
+@app.get("/data/", status_code=status.HTTP_200_OK)
+def export_data(
+    dataset: str = None,
+    format: str = "ndjson",
+    columns: str = None,
+    filter: List[str] = Query(default=[]),
+    group_by: str = None,
+    agg: List[str] = Query(default=[]),
+    after: str = None,
+    limit: int = None,
+):
+    """
+    Consulta direta (somente leitura, sem LLM) à tabela notas_fiscais, com resposta em streaming
+    (ndjson, csv, arrow ou parquet).
+
+    - `columns` / `group_by`: nomes de colunas separados por vírgula.
+    - `filter` (repetível): coluna<op>valor, ex.: `filter=uf_emitente=SP&filter=valor_total>=1000`.
+    - `agg` (repetível): funcao:coluna, ex.: `agg=sum:valor_total&agg=count:*`.
+    - Paginação por chave: `limit` linhas por página e `after` com o `_rowid` da última linha recebida
+      (ou, com agregações, a lista JSON dos valores do group_by da última linha).
+    """
+    logger.info(f"Exportação de dados recebida (dataset: {dataset or 'padrão'}, formato: {format})")
+    _validate_dataset(dataset)
+
+    try:
+        export = prepare_export(
+            get_db_path(dataset), format=format, columns=_split_names(columns), filters=filter,
+            group_by=_split_names(group_by), aggregates=agg, after=after, limit=limit,
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=f"O formato '{format}' exige o pacote pyarrow, que não está disponível.")
+    except (ValueError, sqlite3.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    headers = {}
+    if format != "ndjson":
+        headers["Content-Disposition"] = f'attachment; filename="notas_fiscais.{format}"'
+    # O gerador é consumido em uma thread do pool: as linhas são lidas e enviadas lote a lote
+    return StreamingResponse(iter_export(export), media_type=FORMATS[format], headers=headers)
+
+
+@app.get("/diagnostics/profiles/", status_code=status.HTTP_200_OK)
+def list_diagnostic_profiles():
+    """Lista os perfis gravados (resumo de tempo e memória por etapa), do mais recente para o mais antigo."""
+    return list_profiles()
+
+
+@app.get("/diagnostics/profiles/{profile_id}/", status_code=status.HTTP_200_OK)
+def get_diagnostic_profile(profile_id: str):
+    """Resumo de um perfil, com a lista de arquivos disponíveis para download."""
+    return download_profile_file(profile_id, "summary.json")
+
+
+@app.get("/diagnostics/profiles/{profile_id}/{file_name}", status_code=status.HTTP_200_OK)
+def download_profile_file(profile_id: str, file_name: str):
+    """Download de um arquivo do perfil (profile.prof, profile.txt, memory_*.txt ou summary.json)."""
+    try:
+        path = get_profile_file(profile_id, file_name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return FileResponse(path, filename=file_name)
@@ -1,25 +1,124 @@
 # app/config.py
-import streamlit as st
+import os
+import re
+from functools import lru_cache
 from pathlib import Path
 
-def get_env_var(key, default=None):
-    return st.secrets.get(key, default)
-
 # Caminhos base do projeto
 BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=None)
+def _load_file_settings() -> dict:
+    """
+    Lê as configurações de arquivo uma única vez: `.env` na raiz do projeto e
+    `.streamlit/secrets.toml` (o mesmo arquivo usado pelo Streamlit, lido sem importar o Streamlit).
+    O `.env` tem precedência sobre o secrets.toml.
+    """
+    settings = {}
+    secrets_file = BASE_DIR / ".streamlit" / "secrets.toml"
+    if secrets_file.exists():
+        try:
+            import tomllib  # Python 3.11+
+        except ImportError:
+            tomllib = None
+        if tomllib is not None:
+            with open(secrets_file, "rb") as f:
+                settings.update({k: v for k, v in tomllib.load(f).items() if not isinstance(v, dict)})
+
+    env_file = BASE_DIR / ".env"
+    if env_file.exists():
+        for line in env_file.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            value = value.split(" #", 1)[0].strip()  # Remove comentários no fim da linha
+            settings[key.strip()] = value.strip('"').strip("'")
+    return settings
+
+
+def get_env_var(key, default=None):
+    """Obtém uma configuração das variáveis de ambiente, com fallback para `.env` e `.streamlit/secrets.toml`.
+
+    No Streamlit Cloud os secrets de nível raiz também são expostos como variáveis de ambiente.
+    """
+    if key in os.environ:
+        return os.environ[key]
+    return _load_file_settings().get(key, default)
+
 DB_PATH = BASE_DIR / "data" / "notas.db"
+DATASETS_DIR = BASE_DIR / "data" / "datasets"  # Um arquivo SQLite por dataset/cliente
 INPUT_DIR = BASE_DIR / "data" / "input"
 TEMP_DIR = BASE_DIR / "data" / "temp"
 LOGS_DIR = BASE_DIR / "data" / "logs"
+PROFILES_DIR = BASE_DIR / "data" / "profiles"  # Perfis sob demanda (ver app/profiling.py), criados ao gravar
 MODELS_DIR = BASE_DIR / "models"
+# Serviço de ingestão (python run.py watch): ZIPs processados/rejeitados saem de INPUT_DIR para estas pastas.
+# O prefixo "_" não é válido em ids de dataset, então não se confundem com as subpastas por dataset.
+INGEST_DONE_DIR = INPUT_DIR / "_done"
+INGEST_FAILED_DIR = INPUT_DIR / "_failed"
+INGEST_STATE_PATH = BASE_DIR / "data" / "ingest_state.db"  # Progresso durável da ingestão
 
 # Criar pastas se não existirem
-for d in [INPUT_DIR, TEMP_DIR, LOGS_DIR, MODELS_DIR]:
+for d in [INPUT_DIR, TEMP_DIR, LOGS_DIR, MODELS_DIR, DATASETS_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
-# Variáveis obrigatórias (vêm de st.secrets no Streamlit Cloud)
+# Variáveis obrigatórias (vêm das variáveis de ambiente ou dos secrets no Streamlit Cloud)
 ENV = "cloud"
 HF_TOKEN = get_env_var("HF_TOKEN")
 LLM_CLOUD_MODEL_NAME = get_env_var("LLM_CLOUD_MODEL_NAME", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
 API_BASE_URL = get_env_var("API_BASE_URL")  # ← Obrigatório informar nos secrets
 RENDER_API_URL = get_env_var("RENDER_API_URL")  # ← opcional, você pode remover se não usar
+
+# Backend de inferência do LLM: "transformers", "onnx", "llamacpp" ou "stub" (roteiro fixo, sem modelo)
+LLM_BACKEND = get_env_var("LLM_BACKEND", "transformers" if ENV == "cloud" else "llamacpp")
+LLM_QUANTIZATION = get_env_var("LLM_QUANTIZATION", "none")  # transformers: "none", "int8" (CPU) ou "4bit"
+LLM_LOCAL_MODEL_NAME = get_env_var("LLM_LOCAL_MODEL_NAME", "mistral-7b-instruct-v0.2.Q4_K_M.gguf")
+LLM_LOCAL_MODEL_PATH = MODELS_DIR / LLM_LOCAL_MODEL_NAME  # Modelo GGUF do llama.cpp
+LLM_ONNX_MODEL_DIR = MODELS_DIR / "onnx"  # Modelos exportados para ONNX Runtime (um subdiretório por modelo)
+LLM_STUB_SCRIPT = get_env_var("LLM_STUB_SCRIPT")  # JSON com o roteiro do backend "stub"
+LLM_N_THREADS = int(get_env_var("LLM_N_THREADS", os.cpu_count() or 1))  # Threads de inferência na CPU
+LLM_N_BATCH = int(get_env_var("LLM_N_BATCH", 512))  # llama.cpp: tokens do prompt processados por lote
+LLM_N_CTX = int(get_env_var("LLM_N_CTX", 2048))  # llama.cpp: tamanho do contexto
+LLM_USE_MMAP = str(get_env_var("LLM_USE_MMAP", "true")).lower() == "true"  # llama.cpp: mapeia o modelo em memória
+LLM_USE_MLOCK = str(get_env_var("LLM_USE_MLOCK", "false")).lower() == "true"  # llama.cpp: impede swap do modelo
+LLM_MAX_TOKENS = get_env_var("LLM_MAX_TOKENS")  # Limite de tokens gerados por chamada (padrão depende do backend)
+# Autoavaliação de desempenho na inicialização da API: configurações separadas por ";" (ver app/llm_backends.py)
+LLM_SELF_BENCHMARK = get_env_var("LLM_SELF_BENCHMARK")
+
+# Limites do agente SQL por pergunta: iterações (chamadas de ferramenta), tempo total em segundos
+# e linhas devolvidas ao LLM por consulta (as demais viram um resumo)
+AGENT_MAX_ITERATIONS = int(get_env_var("AGENT_MAX_ITERATIONS", 5))
+AGENT_MAX_EXECUTION_TIME = float(get_env_var("AGENT_MAX_EXECUTION_TIME", 120))
+AGENT_MAX_RESULT_ROWS = int(get_env_var("AGENT_MAX_RESULT_ROWS", 20))
+AGENT_MAX_SCAN_ROWS = int(get_env_var("AGENT_MAX_SCAN_ROWS", 1000))
+
+# Serviço de ingestão: intervalo de varredura de INPUT_DIR (segundos) e processos de ETL em paralelo
+WATCH_POLL_INTERVAL = float(get_env_var("WATCH_POLL_INTERVAL", 1))
+WATCH_WORKERS = int(get_env_var("WATCH_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Ingestão de ZIPs com XMLs de NF-e: processos de leitura em paralelo e arquivos XML por lote
+# (cada lote vira um DataFrame que passa por transformação e carga antes do próximo ser lido).
+# No serviço de ingestão, XML_WORKERS é dividido entre as WATCH_WORKERS cargas simultâneas (ver app/watcher.py).
+XML_WORKERS = int(get_env_var("XML_WORKERS", os.cpu_count() or 1))
+XML_BATCH_FILES = int(get_env_var("XML_BATCH_FILES", 2000))
+
+# Multi-dataset: número máximo de datasets com agente e pool de conexões abertos ao mesmo tempo (LRU)
+MAX_ACTIVE_DATASETS = int(get_env_var("MAX_ACTIVE_DATASETS", 8))
+
+DEFAULT_DATASET = "default"
+_DATASET_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def get_db_path(dataset: str = None) -> Path:
+    """
+    Retorna o caminho do banco SQLite de um dataset/cliente.
+    Sem dataset (ou com "default") usa DB_PATH, mantendo o comportamento de instalação única.
+    """
+    if not dataset or dataset == DEFAULT_DATASET:
+        return DB_PATH
+    if not _DATASET_ID_PATTERN.match(dataset):
+        raise ValueError(f"Identificador de dataset inválido: '{dataset}'. "
+                         f"Use até 64 letras, números, '_' ou '-'.")
+    return DATASETS_DIR / f"{dataset}.db"
@@ -0,0 +1,289 @@
+# app/data_export.py
+import csv
+import io
+import json
+import re
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+from app.config import DB_PATH
+from app.database import reader_uri
+
+# Consultas diretas (sem LLM) à tabela notas_fiscais, com paginação por chave (keyset) e resposta em streaming.
+# As linhas são lidas do SQLite em lotes (fetchmany) e serializadas lote a lote: o resultado nunca é
+# materializado inteiro em memória, nem no banco nem na resposta.
+
+TABLE_NAME = "notas_fiscais"
+BATCH_ROWS = 5000  # Linhas lidas e serializadas por vez
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+FILTER_OPERATORS = [">=", "<=", "!=", "=", ">", "<"]
+
+DataExport = namedtuple("DataExport", ["conn", "sql", "params", "columns", "types", "format"])
+
+
+def _column_types(conn: sqlite3.Connection) -> dict:
+    """Retorna {coluna: tipo declarado} da tabela notas_fiscais."""
+    return {row[1]: (row[2] or "").upper() for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")}
+
+
+def _arrow_type(declared: str) -> str:
+    # Tipos lógicos usados na exportação Arrow/Parquet a partir do tipo declarado no SQLite
+    if "INT" in declared:
+        return "int64"
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB", "NUM")):
+        return "float64"
+    return "string"
+
+
+def parse_filter(expression: str):
+    """Converte 'coluna<op>valor' (ex.: 'uf_emitente=SP', 'valor_total>=1000') em (coluna, operador, valor)."""
+    match = re.match(r"^\s*(\w+)\s*(>=|<=|!=|=|>|<)(.*)$", expression)
+    if not match:
+        raise ValueError(f"Filtro inválido: '{expression}'. Use coluna<op>valor com op em {', '.join(FILTER_OPERATORS)}.")
+    return match.group(1), match.group(2), match.group(3).strip()
+
+
+def parse_aggregate(expression: str):
+    """Converte 'funcao:coluna' (ex.: 'sum:valor_total', 'count:*') em (funcao, coluna)."""
+    function, _, column = expression.partition(":")
+    function = function.strip().lower()
+    if function not in AGGREGATES:
+        raise ValueError(f"Agregação inválida: '{expression}'. Use uma de {', '.join(sorted(AGGREGATES))} como funcao:coluna.")
+    return function, (column.strip() or "*")
+
+
+def _keyset_after(key_columns: list, last: list):
+    """
+    Monta o filtro "grupo depois de `last`" na ordem do ORDER BY (NULL antes de qualquer valor, como no
+    SQLite). A comparação de tuplas (a, b) > (?, ?) resulta em NULL quando há NULL em algum lado e perderia
+    grupos; aqui ela é expandida coluna a coluna, com IS NULL / IS NOT NULL para os valores ausentes:
+        a > ? OR (a = ? AND b > ?) OR ...
+    Retorna (SQL, parâmetros).
+    """
+    alternatives, params = [], []
+    for i, (column, value) in enumerate(zip(key_columns, last)):
+        terms = []
+        for previous_column, previous_value in zip(key_columns[:i], last[:i]):
+            if previous_value is None:
+                terms.append(f"{previous_column} IS NULL")
+            else:
+                terms.append(f"{previous_column} = ?")
+                params.append(previous_value)
+        if value is None:
+            terms.append(f"{column} IS NOT NULL")
+        else:
+            terms.append(f"{column} > ?")  # NULL > ? é falso: grupos com NULL vêm antes
+            params.append(value)
+        alternatives.append(f"({' AND '.join(terms)})")
+    return f"({' OR '.join(alternatives)})", params
+
+
+def prepare_export(
+    db_path: Path = DB_PATH,
+    format: str = "ndjson",
+    columns=None,
+    filters=(),
+    group_by=None,
+    aggregates=(),
+    after: str = None,
+    limit: int = None,
+) -> DataExport:
+    """
+    Valida os parâmetros contra o esquema real da tabela e monta a consulta da exportação.
+
+    - Sem agregações: retorna as linhas com a coluna `_rowid`, ordenadas por ela; `after` é o `_rowid`
+      da última linha recebida (próxima página).
+    - Com `aggregates` (e opcionalmente `group_by`): retorna uma linha por grupo, ordenada pelas colunas
+      do grupo; `after` é uma lista JSON com os valores do grupo da última linha recebida (null para
+      valores ausentes). Sem `group_by` o resultado é uma única linha e `after` é rejeitado.
+
+    Levanta ValueError para parâmetros inválidos, FileNotFoundError se o banco não existe e ImportError
+    se o formato exige pyarrow e ele não está instalado. A conexão aberta é fechada por `iter_export`.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Formato inválido: '{format}'. Use um de {', '.join(FORMATS)}.")
+    if format in ("arrow", "parquet"):
+        import pyarrow  # noqa: F401 - falha cedo, antes de iniciar a resposta
+    if limit is not None and limit <= 0:
+        raise ValueError("limit deve ser maior que zero.")
+    if not Path(db_path).exists():
+        raise FileNotFoundError(f"Banco de dados não encontrado: {db_path}")
+
+    # check_same_thread=False: o streaming pode consumir o gerador a partir de threads diferentes.
+    # O banco publicado é imutável (ver ShadowLoad): a exportação inteira lê o mesmo snapshot.
+    conn = sqlite3.connect(reader_uri(db_path), uri=True, check_same_thread=False)
+    try:
+        table_columns = _column_types(conn)
+        if not table_columns:
+            raise ValueError(f"O banco ainda não tem a tabela {TABLE_NAME}.")
+
+        def check(column):
+            if column not in table_columns:
+                raise ValueError(f"Coluna desconhecida: '{column}'.")
+            return column
+
+        where, params = [], []
+        for expression in filters:
+            column, operator, value = parse_filter(expression)
+            where.append(f'"{check(column)}" {operator} ?')
+            params.append(value)
+
+        group_by = [check(c) for c in group_by or []]
+        aggregates = [parse_aggregate(a) for a in aggregates]
+        if group_by and not aggregates:
+            aggregates = [("count", "*")]
+
+        if aggregates:
+            if columns:
+                raise ValueError("Use 'columns' apenas sem agregações; com agregações as colunas são as do group_by.")
+            select = [f'"{c}"' for c in group_by]
+            out_columns = list(group_by)
+            types = [_arrow_type(table_columns[c]) for c in group_by]
+            for function, column in aggregates:
+                if column == "*":
+                    if function != "count":
+                        raise ValueError(f"'{function}' exige uma coluna.")
+                    select.append("COUNT(*)")
+                    out_columns.append("count")
+                    types.append("int64")
+                    continue
+                select.append(f'{function.upper()}("{check(column)}")')
+                out_columns.append(f"{function}_{column}")
+                types.append({"count": "int64", "sum": "float64", "avg": "float64"}.get(
+                    function, _arrow_type(table_columns[column])))
+            key_columns = [f'"{c}"' for c in group_by]
+            if after is not None:
+                if not group_by:
+                    raise ValueError("'after' não se aplica a agregações sem group_by (o resultado é uma única linha).")
+                try:
+                    last = json.loads(after)
+                except json.JSONDecodeError:
+                    last = None
+                if not isinstance(last, list) or len(last) != len(group_by):
+                    raise ValueError(f"'after' deve ser uma lista JSON com {len(group_by)} valor(es) do group_by.")
+                predicate, predicate_params = _keyset_after(key_columns, last)
+                where.append(predicate)
+                params.extend(predicate_params)
+        else:
+            columns = [check(c) for c in columns] if columns else list(table_columns)
+            select = ["rowid AS _rowid"] + [f'"{c}"' for c in columns]
+            out_columns = ["_rowid"] + columns
+            types = ["int64"] + [_arrow_type(table_columns[c]) for c in columns]
+            key_columns = ["rowid"]
+            if after is not None:
+                if not str(after).isdigit():
+                    raise ValueError("'after' deve ser o _rowid (inteiro) da última linha recebida.")
+                where.append("rowid > ?")
+                params.append(int(after))
+
+        sql = f"SELECT {', '.join(select)} FROM {TABLE_NAME}"
+        if where:
+            sql += f" WHERE {' AND '.join(where)}"
+        if group_by:
+            sql += f" GROUP BY {', '.join(key_columns)}"
+        if group_by or not aggregates:
+            sql += f" ORDER BY {', '.join(key_columns)}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        # Valida a consulta (ex.: tipos de parâmetro) antes de iniciar a resposta
+        conn.execute(f"EXPLAIN {sql}", params)
+    except Exception:
+        conn.close()
+        raise
+    return DataExport(conn=conn, sql=sql, params=params, columns=out_columns, types=types, format=format)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escrita em memória que entrega os bytes acumulados a cada lote (posição contínua para o Parquet)."""
+
+    def __init__(self):
+        self._chunks, self._position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _batches(export: DataExport):
+    cursor = export.conn.execute(export.sql, export.params)
+    while True:
+        rows = cursor.fetchmany(BATCH_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+def _iter_ndjson(export: DataExport):
+    for rows in _batches(export):
+        yield "".join(
+            json.dumps(dict(zip(export.columns, row)), ensure_ascii=False, default=str) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+def _iter_csv(export: DataExport):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.columns)
+    for rows in _batches(export):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Resultado vazio: só o cabeçalho
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _iter_arrow(export: DataExport):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, getattr(pa, arrow_type)()) for name, arrow_type in zip(export.columns, export.types)])
+    sink = _ChunkSink()
+    if export.format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)  # Um row group por lote
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    yield sink.drain()
+
+    for rows in _batches(export):
+        arrays = []
+        for values, field in zip(zip(*rows), schema):
+            if pa.types.is_string(field.type):
+                # O SQLite aceita qualquer valor em qualquer coluna: converte o que não for texto
+                values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(export: DataExport):
+    """Gera o resultado da exportação em blocos de bytes no formato pedido e fecha a conexão ao final."""
+    try:
+        if export.format == "ndjson":
+            yield from _iter_ndjson(export)
+        elif export.format == "csv":
+            yield from _iter_csv(export)
+        else:
+            yield from _iter_arrow(export)
+    finally:
+        export.conn.close()
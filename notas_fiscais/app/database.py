@@ -1,6 +1,11 @@
+import os
 import sqlite3
+import threading
+import time
+import uuid
 import pandas as pd
 from collections import namedtuple
+from pathlib import Path
 # Importa DB_PATH e logger do diretório 'app' usando importação absoluta
 from app.config import DB_PATH
 from app.logger import logger
@@ -8,96 +13,276 @@ from app.logger import logger
 # Define um namedtuple para padronizar os resultados das operações de banco de dados
 DatabaseResult = namedtuple("DatabaseResult", ["status", "message"])
 
+# Arquivos sombra mais antigos que isso são considerados restos de cargas interrompidas
+STALE_SHADOW_SECONDS = 24 * 60 * 60
 
-def save_to_database(df: pd.DataFrame) -> DatabaseResult:
-    """Salva o DataFrame combinado no banco de dados SQLite, criando/substituindo a tabela dinamicamente."""
-    logger.info(f"Salvando dados em {DB_PATH}")
+# Um lock de escrita por arquivo de banco: cargas do mesmo dataset são serializadas,
+# cargas de datasets diferentes (arquivos diferentes) rodam em paralelo sem disputa
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def _get_write_lock(db_path: Path) -> threading.Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(db_path), threading.Lock())
+
+
+# Índice de texto completo (FTS5) sobre descrições de itens e nomes de emitente/destinatário.
+# Tokenização unicode61 com remove_diacritics: "papel" encontra "PAPEL", "cafe" encontra "CAFÉ".
+FTS_TABLE = "notas_fiscais_fts"
+FTS_COLUMN_PATTERNS = ("descricao", "razao_social", "nome")
+
+
+def _fts_columns_for(columns) -> list:
+    """Seleciona as colunas de texto que entram no índice FTS (descrições e nomes)."""
+    return [col for col in columns if any(pattern in col for pattern in FTS_COLUMN_PATTERNS)]
+
+
+def build_fts_index(conn: sqlite3.Connection, table_name: str = "notas_fiscais") -> list:
+    """
+    (Re)cria a tabela FTS5 de conteúdo externo sobre `table_name` e os gatilhos que a mantêm sincronizada
+    em inserções, atualizações e exclusões posteriores. Retorna as colunas indexadas.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    fts_columns = _fts_columns_for(columns)
+    conn.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    if not fts_columns:
+        logger.info("Nenhuma coluna de descrição/nome encontrada. Índice FTS não criado.")
+        return []
+
+    column_list = ", ".join(fts_columns)
+    new_values = ", ".join(f"new.{col}" for col in fts_columns)
+    old_values = ", ".join(f"old.{col}" for col in fts_columns)
+    conn.executescript(f"""
+        CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+            {column_list}, content='{table_name}', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild');
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table_name} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+        END;
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table_name} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+        END;
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {table_name} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {column_list}) VALUES (new.rowid, {new_values});
+        END;
+    """)
+    logger.info(f"Índice FTS '{FTS_TABLE}' criado sobre: {fts_columns}")
+    return fts_columns
+
+
+def get_fts_columns(db_path: Path = DB_PATH) -> list:
+    """Retorna as colunas do índice FTS do banco (lista vazia se o banco não tem índice)."""
+    conn = sqlite3.connect(reader_uri(db_path), uri=True)
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone()
+        if not exists:
+            return []
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({FTS_TABLE})")]
+    finally:
+        conn.close()
+
+
+def get_data_version(db_path: Path = DB_PATH):
+    """
+    Retorna um identificador da versão dos dados do banco (inode, tamanho e mtime do arquivo),
+    ou None se o banco ainda não existe. Não abre conexão, portanto não disputa locks com escritores.
+    """
+    try:
+        stat = Path(db_path).stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _prepare_table(df: pd.DataFrame, table_name: str) -> str:
+    """
+    Converte as colunas do DataFrame para tipos suportados pelo SQLite (datas, booleanos, listas/dicts)
+    e retorna a instrução CREATE TABLE correspondente.
+    """
+    # Gera as definições de coluna para a instrução CREATE TABLE
+    column_definitions = []
+    df_columns = df.columns.tolist()
+
+    pk_column = None
+    # Procura por uma coluna candidata a chave primária
+    # Preferência para chaves que identifiquem unicamente as notas fiscais
+    for key_candidate in ["chave_de_acesso", "chave", "id_nota", "numero_nf", "id"]:
+        if key_candidate in df_columns:
+            pk_column = key_candidate
+            break
+
+    if pk_column:
+        # Adiciona a chave primária com tipo TEXT
+        column_definitions.append(f"{pk_column} TEXT PRIMARY KEY")
+        df_columns.remove(pk_column)  # Remove da lista para evitar duplicidade
+    else:
+        logger.warning("Nenhuma coluna candidata a PRIMARY KEY encontrada. A tabela pode ter chaves duplicadas.")
+        # Se não há PK, pode-se adicionar uma PK AUTOINCREMENT, mas para simplicidade, deixamos assim.
+
+    # Itera sobre as colunas restantes para inferir o tipo SQL
+    for col in df_columns:
+        # Normaliza o nome da coluna para ser seguro para SQL
+        safe_col_name = "".join(c if c.isalnum() else "_" for c in col)
+
+        if pd.api.types.is_integer_dtype(df[col]):
+            sql_type = "INTEGER"
+        elif pd.api.types.is_float_dtype(df[col]):
+            sql_type = "REAL"
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            sql_type = "TEXT" # Armazena datas como TEXT (formato ISO)
+            df[col] = df[col].astype(str)  # Converte para string ISO formatada
+        elif pd.api.types.is_bool_dtype(df[col]):
+            sql_type = "INTEGER"  # SQLite não tem BOOLEAN nativo, usa INTEGER (0 ou 1)
+            df[col] = df[col].astype(int)
+        else:  # Fallback para TEXT para strings e outros tipos
+            sql_type = "TEXT"
+            # Se houver listas/dicts, serializá-los para string
+            if df[col].apply(lambda x: isinstance(x, (list, dict))).any():
+                df[col] = df[col].astype(str)
+
+        # Adiciona a definição da coluna (nome_seguro TIPO_SQL)
+        column_definitions.append(f"{safe_col_name} {sql_type}")
+
+    # Cria a instrução SQL para criar a tabela.
+    # Usa um set para garantir colunas únicas, caso haja alguma duplicação acidental
+    # e então junta com vírgula.
+    return f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(set(column_definitions))})"
+
+
+class ShadowLoad:
+    """
+    Carga atômica de um banco: os dados são gravados em um arquivo sombra ao lado do banco publicado e,
+    depois de construídos os índices, o arquivo sombra substitui o publicado com os.replace (rename atômico).
+
+    Leitores nunca veem uma tabela ausente ou pela metade: conexões abertas continuam lendo o arquivo
+    anterior (snapshot) e novas conexões abrem o arquivo novo. Como um arquivo publicado nunca mais é
+    alterado, os leitores podem abri-lo como imutável, sem locks (ver `reader_uri`).
+
+    Uso:
+        with ShadowLoad(db_path) as load:
+            load.append(df)  # uma ou mais vezes
+            load.publish()
+    Se `publish` não for chamado (ou houver exceção), o arquivo sombra é descartado e o banco publicado
+    permanece intacto.
+    """
+
+    table_name = "notas_fiscais" # Nome da tabela no banco de dados
+
+    def __init__(self, db_path: Path = DB_PATH):
+        self.db_path = Path(db_path)
+        self.shadow_path = self.db_path.with_name(f".{self.db_path.name}.{uuid.uuid4().hex}.loading")
+        self.rows = 0
+        self.conn = None
+        self._lock = _get_write_lock(self.db_path)
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._remove_stale_shadows()
+            self.conn = sqlite3.connect(self.shadow_path)
+            # O arquivo sombra é descartável: sem journal nem fsync durante a carga (a durabilidade vem do
+            # fsync feito na publicação)
+            self.conn.execute("PRAGMA journal_mode=OFF")
+            self.conn.execute("PRAGMA synchronous=OFF")
+        except Exception:
+            self._discard()
+            raise
+        return self
+
+    def append(self, df: pd.DataFrame) -> None:
+        """Acrescenta um lote de linhas à tabela do arquivo sombra (o primeiro lote define o esquema)."""
+        if self.rows == 0:
+            create_table_sql = _prepare_table(df, self.table_name)
+            logger.info(f"Criando/atualizando esquema da tabela '{self.table_name}'. SQL: {create_table_sql}")
+            self.conn.execute(create_table_sql) # Executa a criação da tabela
+            # if_exists='replace' recria a tabela com o esquema inferido pelo pandas a partir do DataFrame.
+            # index=False evita que o índice do DataFrame seja salvo como uma coluna.
+            df.to_sql(self.table_name, self.conn, if_exists="replace", index=False)
+        else:
+            _prepare_table(df, self.table_name)  # Mesmas conversões de tipo do primeiro lote
+            df.to_sql(self.table_name, self.conn, if_exists="append", index=False)
+        self.conn.commit() # Confirma a transação de inserção
+        self.rows += len(df)
+
+    def publish(self) -> None:
+        """Constrói os índices no arquivo sombra e o publica atomicamente no lugar do banco."""
+        # Índice de texto completo para buscas por produto/fornecedor sem varrer a tabela
+        build_fts_index(self.conn, self.table_name)
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+
+        # Grava o arquivo sombra em disco antes da troca e o rename em seguida
+        _fsync(self.shadow_path)
+        os.replace(self.shadow_path, self.db_path)
+        _fsync(self.db_path.parent)
+        logger.info(f"Banco publicado em {self.db_path} ({self.rows} registros).")
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._discard()
+        finally:
+            self._lock.release()
+        return False
+
+    def _discard(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.shadow_path.exists():
+            self.shadow_path.unlink()
+            logger.info(f"Arquivo sombra descartado: {self.shadow_path.name}")
+
+    def _remove_stale_shadows(self):
+        # Arquivos sombra de cargas interrompidas (ex.: processo encerrado no meio da carga)
+        for stale in self.db_path.parent.glob(f".{self.db_path.name}.*.loading"):
+            if time.time() - stale.stat().st_mtime > STALE_SHADOW_SECONDS:
+                stale.unlink(missing_ok=True)
+                logger.info(f"Arquivo sombra abandonado removido: {stale.name}")
+
+
+def _fsync(path: Path) -> None:
+    # Em um diretório, garante que o rename do arquivo sombra sobreviva a uma queda de energia
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def reader_uri(db_path: Path = DB_PATH) -> str:
+    """
+    URI SQLite para leitura de um banco publicado: somente leitura e imutável (sem locks).
+    O caminho é codificado (as_uri): "#", "?" ou "%" no nome de uma pasta não cortam nem alteram a URI.
+    """
+    return f"{Path(db_path).absolute().as_uri()}?mode=ro&immutable=1"
+
+
+def save_to_database(df: pd.DataFrame, db_path: Path = DB_PATH) -> DatabaseResult:
+    """
+    Salva o DataFrame combinado no banco de dados SQLite, substituindo a tabela dinamicamente.
+    A carga é feita em um arquivo sombra publicado atomicamente (ver ShadowLoad).
+    """
+    logger.info(f"Salvando dados em {db_path}")
     if df.empty:
         msg = "DataFrame vazio, nada para salvar."
         logger.warning(msg)
         return DatabaseResult(status="warning", message=msg)
 
-    conn = None # Inicializa a conexão como None
     try:
-        # Conecta ao banco de dados SQLite. Se o arquivo não existir, ele será criado.
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        table_name = "notas_fiscais" # Nome da tabela no banco de dados
-
-        # Gera as definições de coluna para a instrução CREATE TABLE
-        column_definitions = []
-        df_columns = df.columns.tolist()
-
-        pk_column = None
-        # Procura por uma coluna candidata a chave primária
-        # Preferência para chaves que identifiquem unicamente as notas fiscais
-        for key_candidate in ["chave_de_acesso", "chave", "id_nota", "numero_nf", "id"]:
-            if key_candidate in df_columns:
-                pk_column = key_candidate
-                break
-
-        if pk_column:
-            # Adiciona a chave primária com tipo TEXT
-            column_definitions.append(f"{pk_column} TEXT PRIMARY KEY")
-            df_columns.remove(pk_column)  # Remove da lista para evitar duplicidade
-        else:
-            logger.warning("Nenhuma coluna candidata a PRIMARY KEY encontrada. A tabela pode ter chaves duplicadas.")
-            # Se não há PK, pode-se adicionar uma PK AUTOINCREMENT, mas para simplicidade, deixamos assim.
-
-        # Itera sobre as colunas restantes para inferir o tipo SQL
-        for col in df_columns:
-            # Normaliza o nome da coluna para ser seguro para SQL
-            safe_col_name = "".join(c if c.isalnum() else "_" for c in col)
-
-            if pd.api.types.is_integer_dtype(df[col]):
-                sql_type = "INTEGER"
-            elif pd.api.types.is_float_dtype(df[col]):
-                sql_type = "REAL"
-            elif pd.api.types.is_datetime64_any_dtype(df[col]):
-                sql_type = "TEXT" # Armazena datas como TEXT (formato ISO)
-                df[col] = df[col].astype(str)  # Converte para string ISO formatada
-            elif pd.api.types.is_bool_dtype(df[col]):
-                sql_type = "INTEGER"  # SQLite não tem BOOLEAN nativo, usa INTEGER (0 ou 1)
-                df[col] = df[col].astype(int)
-            else:  # Fallback para TEXT para strings e outros tipos
-                sql_type = "TEXT"
-                # Se houver listas/dicts, serializá-los para string
-                if df[col].apply(lambda x: isinstance(x, (list, dict))).any():
-                    df[col] = df[col].astype(str)
-
-            # Adiciona a definição da coluna (nome_seguro TIPO_SQL)
-            column_definitions.append(f"{safe_col_name} {sql_type}")
-
-        # Cria a instrução SQL para criar a tabela.
-        # Usa um set para garantir colunas únicas, caso haja alguma duplicação acidental
-        # e então junta com vírgula.
-        create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(set(column_definitions))})"
-
-        logger.info(f"Criando/atualizando esquema da tabela '{table_name}'. SQL: {create_table_sql}")
-        cursor.execute(create_table_sql) # Executa a criação da tabela
-        conn.commit() # Confirma a transação
-
-        # Usa df.to_sql para inserir os dados.
-        # if_exists='replace' sobrescreve a tabela inteira se ela já existe.
-        # index=False evita que o índice do DataFrame seja salvo como uma coluna.
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
-        conn.commit() # Confirma a transação de inserção
-
-        logger.info(f"Dados salvos em '{table_name}'. Total de registros: {len(df)}")
+        with ShadowLoad(db_path) as load:
+            load.append(df)
+            load.publish()
+        logger.info(f"Dados salvos em '{ShadowLoad.table_name}'. Total de registros: {len(df)}")
         return DatabaseResult(status="success", message="Dados salvos com sucesso.")
 
     except sqlite3.Error as e:
         logger.error(f"Erro SQLite: {e}", exc_info=True)
-        if conn:
-            conn.rollback() # Reverte a transação em caso de erro
         return DatabaseResult(status="error", message=f"Erro no banco de dados: {str(e)}")
     except Exception as e:
         logger.error(f"Erro inesperado ao salvar: {e}", exc_info=True)
-        if conn:
-            conn.rollback() # Reverte a transação em caso de erro
         return DatabaseResult(status="error", message=f"Erro inesperado ao salvar: {str(e)}")
-    finally:
-        if conn:
-            conn.close() # Sempre fecha a conexão
-            logger.info("Conexão DB fechada.")
\ No newline at end of file
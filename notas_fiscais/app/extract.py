@@ -1,6 +1,8 @@
 # app/extract.py
 from pathlib import Path
 from collections import namedtuple
+import shutil
+import tempfile
 import zipfile
 import pandas as pd
 # Importa TEMP_DIR e logger do diretório 'app' usando importação absoluta
@@ -14,8 +16,9 @@ ExtractResult = namedtuple("ExtractResult", ["cabecalho", "itens"])
 def extract_zip(file_path: Path) -> ExtractResult:
     """Extrai arquivos CSV de um .zip e retorna como DataFrames."""
     logger.info(f"Iniciando extração do arquivo ZIP: {file_path.name}")
-    temp_path = TEMP_DIR # Diretório temporário para extração
-    temp_path.mkdir(parents=True, exist_ok=True) # Garante que o diretório exista
+    TEMP_DIR.mkdir(parents=True, exist_ok=True) # Garante que o diretório exista
+    # Subdiretório exclusivo desta extração, para que cargas paralelas não misturem nem apaguem arquivos umas das outras
+    temp_path = Path(tempfile.mkdtemp(prefix="extract_", dir=TEMP_DIR))
 
     try:
         with zipfile.ZipFile(file_path, 'r') as zip_ref:
@@ -93,11 +96,5 @@ def extract_zip(file_path: Path) -> ExtractResult:
         raise
     finally:
         # Limpa os arquivos temporários extraídos
-        for file in temp_path.glob("*"):
-            if file.is_file():
-                try:
-                    file.unlink() # Remove o arquivo
-                    logger.debug(f"Arquivo temporário removido: {file.name}")
-                except OSError as e:
-                    logger.warning(f"Não foi possível remover arquivo temporário '{file.name}': {e}")
+        shutil.rmtree(temp_path, ignore_errors=True)
         logger.info(f"Arquivos temporários em {temp_path} limpos.")
\ No newline at end of file
@@ -0,0 +1,197 @@
+# app/extract_xml.py
+import zipfile
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from xml.etree.ElementTree import ParseError, iterparse
+import pandas as pd
+from app.config import XML_BATCH_FILES, XML_WORKERS
+from app.extract import ExtractResult
+from app.logger import logger
+
+# Extração de ZIPs com um XML de NF-e por nota (layout nfeProc/NFe/infNFe da SEFAZ).
+# Os XMLs são lidos direto do ZIP, sem extrair para disco, com um parser em streaming (iterparse),
+# em lotes distribuídos entre processos. Cada lote é devolvido como ExtractResult com as mesmas colunas
+# dos CSVs de cabeçalho e itens, para seguir pelas etapas de transformação e carga existentes.
+
+# Caminho do campo (relativo a infNFe) -> coluna do CSV de cabeçalho. Campos alternativos (ex.: CNPJ ou CPF)
+# apontam para a mesma coluna; vale o primeiro encontrado.
+CABECALHO_FIELDS = {
+    "ide/mod": "MODELO",
+    "ide/serie": "SÉRIE",
+    "ide/nNF": "NÚMERO",
+    "ide/natOp": "NATUREZA DA OPERAÇÃO",
+    "ide/dhEmi": "DATA EMISSÃO",
+    "ide/dEmi": "DATA EMISSÃO",  # Layout anterior à versão 3.10
+    "emit/CNPJ": "CPF/CNPJ Emitente",
+    "emit/CPF": "CPF/CNPJ Emitente",
+    "emit/xNome": "RAZÃO SOCIAL EMITENTE",
+    "emit/IE": "INSCRIÇÃO ESTADUAL EMITENTE",
+    "emit/enderEmit/UF": "UF EMITENTE",
+    "emit/enderEmit/xMun": "MUNICÍPIO EMITENTE",
+    "dest/CNPJ": "CNPJ DESTINATÁRIO",
+    "dest/CPF": "CNPJ DESTINATÁRIO",
+    "dest/xNome": "NOME DESTINATÁRIO",
+    "dest/enderDest/UF": "UF DESTINATÁRIO",
+    "dest/indIEDest": "INDICADOR IE DESTINATÁRIO",
+    "ide/idDest": "DESTINO DA OPERAÇÃO",
+    "ide/indFinal": "CONSUMIDOR FINAL",
+    "ide/indPres": "PRESENÇA DO COMPRADOR",
+    "total/ICMSTot/vNF": "VALOR NOTA FISCAL",
+}
+# Caminho do campo (relativo a det) -> coluna do CSV de itens
+ITEM_FIELDS = {
+    "prod/xProd": "DESCRIÇÃO DO PRODUTO/SERVIÇO",
+    "prod/NCM": "CÓDIGO NCM/SH",
+    "prod/CFOP": "CFOP",
+    "prod/qCom": "QUANTIDADE",
+    "prod/uCom": "UNIDADE",
+    "prod/vUnCom": "VALOR UNITÁRIO",
+    "prod/vProd": "VALOR TOTAL",
+}
+KEY_COLUMN = "CHAVE DE ACESSO"
+CABECALHO_COLUMNS = [KEY_COLUMN] + list(dict.fromkeys(CABECALHO_FIELDS.values()))
+ITENS_COLUMNS = [KEY_COLUMN, "NÚMERO PRODUTO"] + list(ITEM_FIELDS.values())
+# Colunas convertidas para número, como o read_csv faria com os CSVs
+INTEGER_COLUMNS = {"NÚMERO", "NÚMERO PRODUTO"}
+FLOAT_COLUMNS = {"VALOR NOTA FISCAL", "QUANTIDADE", "VALOR UNITÁRIO", "VALOR TOTAL"}
+# Datas gravadas como nos CSVs ("AAAA-MM-DD hh:mm:ss"). dhEmi traz a hora local com o fuso
+# ("2024-01-02T10:00:00-03:00"): fica a hora local, sem o fuso; dEmi (layout antigo) só tem a data.
+DATE_COLUMNS = {"DATA EMISSÃO"}
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def is_xml_archive(file_path: Path) -> bool:
+    """Indica se o ZIP contém XMLs de NF-e (e não o par de CSVs de cabeçalho e itens)."""
+    with zipfile.ZipFile(file_path) as zip_ref:
+        names = [name.lower() for name in zip_ref.namelist()]
+    return any(name.endswith(".xml") for name in names) and sum(name.endswith(".csv") for name in names) < 2
+
+
+def _convert(column: str, value: str):
+    if value is None:
+        return None
+    if column in INTEGER_COLUMNS:
+        return int(value)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    if column in DATE_COLUMNS:
+        return datetime.fromisoformat(value.strip()).strftime(CSV_DATE_FORMAT)
+    return value
+
+
+def parse_nfe(source):
+    """
+    Lê um XML de NF-e em streaming e retorna (linha de cabeçalho, linhas de itens) como dicts com as
+    colunas dos CSVs. Retorna (None, []) se o XML não é uma NF-e (ex.: XML de evento ou cancelamento).
+    Cada elemento é descartado assim que lido, então a memória não cresce com o número de itens.
+    """
+    cabecalho, itens, item = {}, [], None
+    path, base = [], None  # Tags abertas (sem namespace) e posição de infNFe nessa pilha enquanto aberto
+    found, protocol_key = False, None
+
+    for event, elem in iterparse(source, events=("start", "end")):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            path.append(tag)
+            if tag == "infNFe" and not found:
+                found, base = True, len(path)
+                cabecalho[KEY_COLUMN] = elem.get("Id", "").removeprefix("NFe") or None
+            elif tag == "det" and base is not None:
+                item = {"NÚMERO PRODUTO": elem.get("nItem")}
+            continue
+
+        if base is not None and len(path) == base:  # Fim do <infNFe>
+            base = None
+        elif base is not None:
+            relative = path[base:]
+            if relative[0] == "det" and item is not None:
+                column = ITEM_FIELDS.get("/".join(relative[1:]))
+                if column and column not in item:
+                    item[column] = elem.text
+                if len(relative) == 1:  # Fim do <det>
+                    itens.append(item)
+                    item = None
+            else:
+                column = CABECALHO_FIELDS.get("/".join(relative))
+                if column and column not in cabecalho:
+                    cabecalho[column] = elem.text
+        elif tag == "chNFe":
+            protocol_key = elem.text  # Chave no protocolo de autorização (protNFe)
+        path.pop()
+        elem.clear()
+
+    if not found:
+        return None, []
+    cabecalho[KEY_COLUMN] = cabecalho.get(KEY_COLUMN) or protocol_key
+    for row in itens:
+        row[KEY_COLUMN] = cabecalho[KEY_COLUMN]
+    cabecalho = {column: _convert(column, cabecalho.get(column)) for column in CABECALHO_COLUMNS}
+    itens = [{column: _convert(column, row.get(column)) for column in ITENS_COLUMNS} for row in itens]
+    return cabecalho, itens
+
+
+def parse_members(zip_path: Path, names: list):
+    """Lê um lote de XMLs do ZIP. Executado nos processos do pool: retorna (cabeçalhos, itens, XMLs ignorados)."""
+    cabecalhos, itens, skipped = [], [], []
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        for name in names:
+            try:
+                with zip_ref.open(name) as stream:
+                    cabecalho, rows = parse_nfe(stream)
+            except (ParseError, ValueError) as e:
+                skipped.append(f"{name}: {e}")
+                continue
+            if cabecalho is None:
+                skipped.append(f"{name}: não é uma NF-e")
+                continue
+            cabecalhos.append(cabecalho)
+            itens.extend(rows)
+    return cabecalhos, itens, skipped
+
+
+def _to_frame(rows: list, columns: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=columns)
+    if df.empty:
+        # Sem linhas o pandas não infere tipos: as colunas numéricas ficam com o tipo que teriam em um lote
+        # com dados (o primeiro lote gravado define os tipos das colunas no banco)
+        df = df.astype({c: "int64" if c in INTEGER_COLUMNS else "float64"
+                        for c in columns if c in INTEGER_COLUMNS | FLOAT_COLUMNS})
+    return df
+
+
+def _to_result(cabecalhos: list, itens: list) -> ExtractResult:
+    return ExtractResult(cabecalho=_to_frame(cabecalhos, CABECALHO_COLUMNS), itens=_to_frame(itens, ITENS_COLUMNS))
+
+
+def iter_xml_batches(file_path: Path, files_per_batch: int = XML_BATCH_FILES, workers: int = XML_WORKERS):
+    """
+    Gera ExtractResult por lote de `files_per_batch` XMLs do ZIP, na ordem do arquivo.
+    Os lotes são lidos em paralelo por `workers` processos, com no máximo 2 lotes por processo em andamento,
+    para que a memória fique estável independentemente do tamanho do ZIP.
+    """
+    with zipfile.ZipFile(file_path) as zip_ref:
+        names = [info.filename for info in zip_ref.infolist()
+                 if not info.is_dir() and info.filename.lower().endswith(".xml")]
+    batches = [names[i:i + files_per_batch] for i in range(0, len(names), files_per_batch)]
+    logger.info(f"{len(names)} XMLs encontrados em {file_path.name}: {len(batches)} lote(s) de até {files_per_batch}.")
+
+    def report(index, cabecalhos, itens, skipped):
+        if skipped:
+            logger.warning(f"Lote {index + 1}: {len(skipped)} XML(s) ignorado(s). Primeiro: {skipped[0]}")
+        logger.info(f"Lote {index + 1}/{len(batches)} lido: {len(cabecalhos)} notas, {len(itens)} itens.")
+        return _to_result(cabecalhos, itens)
+
+    if workers <= 1 or len(batches) <= 1:
+        for index, batch in enumerate(batches):
+            yield report(index, *parse_members(file_path, batch))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+        in_flight, submitted = deque(), 0
+        for index in range(len(batches)):
+            while submitted < len(batches) and len(in_flight) < 2 * workers:
+                in_flight.append(executor.submit(parse_members, file_path, batches[submitted]))
+                submitted += 1
+            yield report(index, *in_flight.popleft().result())
@@ -0,0 +1,276 @@
+# app/llm_backends.py
+import json
+import time
+from collections import namedtuple
+from pathlib import Path
+from app.config import (
+    HF_TOKEN, LLM_BACKEND, LLM_CLOUD_MODEL_NAME, LLM_LOCAL_MODEL_PATH, LLM_MAX_TOKENS, LLM_N_BATCH,
+    LLM_N_CTX, LLM_N_THREADS, LLM_ONNX_MODEL_DIR, LLM_QUANTIZATION, LLM_STUB_SCRIPT, LLM_USE_MLOCK, LLM_USE_MMAP,
+)
+from app.logger import logger
+
+# As bibliotecas de cada backend (transformers/torch, optimum/onnxruntime, llama-cpp-python) são importadas
+# apenas dentro da função que cria aquele backend.
+
+# Configuração de um backend de inferência; use settings._replace(...) para variações
+LLMSettings = namedtuple("LLMSettings", [
+    "backend", "model_name", "model_path", "quantization",
+    "n_threads", "n_batch", "n_ctx", "use_mmap", "use_mlock", "max_tokens",
+])
+
+# Resultado da autoavaliação de desempenho de uma configuração
+BenchmarkResult = namedtuple("BenchmarkResult", [
+    "label", "status", "load_seconds", "prompt_tokens", "generated_tokens", "tokens_per_second", "message",
+])
+
+BACKENDS = ("transformers", "onnx", "llamacpp", "stub")
+
+# Prompt fixo da autoavaliação, no formato das perguntas que o agente recebe
+BENCHMARK_PROMPT = (
+    "Você é um analista de dados. Tabela notas_fiscais(chave_de_acesso TEXT, razao_social_emitente TEXT, "
+    "descricao_do_produto_servico TEXT, quantidade REAL, valor_total REAL).\n"
+    "Escreva uma consulta SQL para responder: Qual fornecedor recebeu o maior montante total?\nSQL:"
+)
+
+
+def load_settings() -> LLMSettings:
+    """Monta a configuração do backend a partir das variáveis de ambiente (app/config.py)."""
+    backend = LLM_BACKEND
+    if backend == "llamacpp":
+        model_path = LLM_LOCAL_MODEL_PATH
+    elif backend == "stub":
+        model_path = Path(LLM_STUB_SCRIPT) if LLM_STUB_SCRIPT else None
+    else:
+        model_path = None
+    return LLMSettings(
+        backend=backend,
+        model_name=LLM_CLOUD_MODEL_NAME,
+        model_path=model_path,
+        quantization=LLM_QUANTIZATION,
+        n_threads=LLM_N_THREADS,
+        n_batch=LLM_N_BATCH,
+        n_ctx=LLM_N_CTX,
+        use_mmap=LLM_USE_MMAP,
+        use_mlock=LLM_USE_MLOCK,
+        # Padrões históricos: 512 tokens no transformers/ONNX, 256 no llama.cpp
+        max_tokens=int(LLM_MAX_TOKENS) if LLM_MAX_TOKENS else (256 if backend == "llamacpp" else 512),
+    )
+
+
+def create_llm(settings: LLMSettings):
+    """Cria a instância LangChain do LLM para o backend configurado."""
+    if settings.backend not in BACKENDS:
+        raise ValueError(f"Backend de LLM desconhecido: '{settings.backend}'. Use um de: {', '.join(BACKENDS)}.")
+    logger.info(f"Carregando LLM: {describe(settings)}")
+    if settings.backend == "transformers":
+        return _create_transformers(settings)
+    if settings.backend == "onnx":
+        return _create_onnx(settings)
+    if settings.backend == "llamacpp":
+        return _create_llamacpp(settings)
+    return _create_stub(settings)
+
+
+def describe(settings: LLMSettings) -> str:
+    """Resumo legível da configuração, usado em logs e no relatório da autoavaliação."""
+    if settings.backend == "llamacpp":
+        return (f"llamacpp {Path(settings.model_path).name} threads={settings.n_threads} batch={settings.n_batch} "
+                f"ctx={settings.n_ctx} mmap={settings.use_mmap} mlock={settings.use_mlock}")
+    if settings.backend in ("transformers", "onnx"):
+        quantization = f" quant={settings.quantization}" if settings.backend == "transformers" else ""
+        return f"{settings.backend} {settings.model_name}{quantization} threads={settings.n_threads}"
+    return "stub"
+
+
+def _login_hf():
+    # Autentica no Hugging Face Hub (mesmo para modelos públicos, para evitar rate limits)
+    if not HF_TOKEN:
+        raise ValueError("HF_TOKEN não definido. Necessário para acessar modelos Hugging Face na nuvem.")
+    from huggingface_hub import login
+    login(token=HF_TOKEN)
+
+
+def _text_generation_llm(model, tokenizer, settings: LLMSettings, **pipeline_kwargs):
+    """Envolve modelo e tokenizer em um pipeline de geração de texto do LangChain."""
+    from langchain_community.llms import HuggingFacePipeline
+    from transformers import pipeline
+
+    # Cria um pipeline de geração de texto com o modelo carregado
+    pipe = pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        max_new_tokens=settings.max_tokens,  # Limita o número de novos tokens gerados
+        temperature=0.01,  # Controla a aleatoriedade da saída (valores menores para mais determinismo)
+        do_sample=True,  # Permite amostragem para diversidade
+        top_k=50,  # Considera apenas os 50 tokens mais prováveis
+        num_return_sequences=1,  # Retorna apenas uma sequência gerada
+        **pipeline_kwargs,
+    )
+    return HuggingFacePipeline(pipeline=pipe)
+
+
+def _create_transformers(settings: LLMSettings):
+    """
+    Modelo Hugging Face via transformers. Quantização:
+      - "none": pesos originais, device_map="auto" (GPU se houver)
+      - "int8": quantização dinâmica int8 das camadas Linear (torch), para nós só com CPU
+      - "4bit": bitsandbytes NF4 (requer um dispositivo suportado pelo bitsandbytes)
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    _login_hf()
+    torch.set_num_threads(settings.n_threads)
+    tokenizer = AutoTokenizer.from_pretrained(settings.model_name, trust_remote_code=True)
+
+    if settings.quantization == "int8":
+        model = AutoModelForCausalLM.from_pretrained(settings.model_name, trust_remote_code=True,
+                                                     torch_dtype=torch.float32)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return _text_generation_llm(model, tokenizer, settings, device=-1)
+    if settings.quantization == "4bit":
+        from transformers import BitsAndBytesConfig
+        quantization_config = BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_quant_type="nf4",
+                                                 bnb_4bit_compute_dtype=torch.bfloat16)
+        model = AutoModelForCausalLM.from_pretrained(settings.model_name, trust_remote_code=True,
+                                                     quantization_config=quantization_config, device_map="auto")
+        return _text_generation_llm(model, tokenizer, settings)
+    if settings.quantization != "none":
+        raise ValueError(f"Quantização desconhecida: '{settings.quantization}'. Use 'none', 'int8' ou '4bit'.")
+
+    model = AutoModelForCausalLM.from_pretrained(
+        settings.model_name,
+        trust_remote_code=True,
+        device_map="auto",  # Permite que transformers use CPU/GPU automaticamente
+    )
+    return _text_generation_llm(model, tokenizer, settings)
+
+
+def _create_onnx(settings: LLMSettings):
+    """Modelo Hugging Face exportado para ONNX Runtime (CPU). A exportação é feita uma vez e reaproveitada."""
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    _login_hf()
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = settings.n_threads
+    export_dir = LLM_ONNX_MODEL_DIR / settings.model_name.replace("/", "__")
+
+    if export_dir.exists():
+        model = ORTModelForCausalLM.from_pretrained(export_dir, session_options=session_options)
+        tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    else:
+        logger.info(f"Exportando {settings.model_name} para ONNX em {export_dir} (apenas na primeira execução).")
+        model = ORTModelForCausalLM.from_pretrained(settings.model_name, export=True, session_options=session_options)
+        tokenizer = AutoTokenizer.from_pretrained(settings.model_name, trust_remote_code=True)
+        model.save_pretrained(export_dir)
+        tokenizer.save_pretrained(export_dir)
+    return _text_generation_llm(model, tokenizer, settings)
+
+
+def _create_llamacpp(settings: LLMSettings):
+    """Modelo GGUF via llama.cpp, com threads, lote, contexto e mmap/mlock configuráveis."""
+    from langchain_community.llms import LlamaCpp
+
+    model_path = Path(settings.model_path)
+    if not model_path.exists():
+        raise FileNotFoundError(f"Modelo local não encontrado em {model_path}. "
+                                f"Certifique-se de baixar o modelo ou ajustar LLM_LOCAL_MODEL_NAME.")
+    # Inicializa o modelo LlamaCpp para inferência local
+    return LlamaCpp(
+        model_path=str(model_path),
+        temperature=0.01,  # Controla a aleatoriedade
+        max_tokens=settings.max_tokens,  # Limite de tokens na resposta
+        top_p=0.9,  # Amostragem de núcleo
+        n_ctx=settings.n_ctx,  # Tamanho do contexto (número máximo de tokens de entrada)
+        n_threads=settings.n_threads,  # Threads de CPU para geração
+        n_batch=settings.n_batch,  # Tokens do prompt avaliados por lote
+        use_mmap=settings.use_mmap,
+        use_mlock=settings.use_mlock,
+        n_gpu_layers=0,  # Número de camadas a descarregar na GPU (0 para CPU)
+        verbose=False  # Desativa logs verbosos do LlamaCpp
+    )
+
+
+def _create_stub(settings: LLMSettings):
+    """LLM falso que reproduz um roteiro JSON ({pergunta: {"sql": [...], "answer": "..."}})."""
+    from app.llm_stub import StubChatModel
+
+    script = json.loads(Path(settings.model_path).read_text(encoding="utf-8")) if settings.model_path else {}
+    return StubChatModel(script=script)
+
+
+def parse_benchmark_configs(spec: str, base: LLMSettings):
+    """
+    Converte a especificação de configurações da autoavaliação em LLMSettings.
+
+    Formato: configurações separadas por ";", cada uma como "backend:chave=valor,chave=valor",
+    com chaves iguais aos campos de LLMSettings. Ex.:
+        "llamacpp:n_threads=4,n_batch=256;llamacpp:n_threads=8,n_batch=512;transformers:quantization=int8"
+    """
+    configs = []
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        backend, _, options = item.partition(":")
+        overrides = {"backend": backend.strip()}
+        if backend.strip() == "llamacpp" and base.backend != "llamacpp":
+            overrides["model_path"] = LLM_LOCAL_MODEL_PATH
+        for option in filter(None, (o.strip() for o in options.split(","))):
+            key, _, value = option.partition("=")
+            key = key.strip()
+            if key not in LLMSettings._fields:
+                raise ValueError(f"Opção desconhecida na autoavaliação: '{key}'.")
+            current = getattr(base, key)
+            if isinstance(current, bool):
+                overrides[key] = value.strip().lower() == "true"
+            elif isinstance(current, int):
+                overrides[key] = int(value)
+            else:
+                overrides[key] = value.strip()
+        configs.append(base._replace(**overrides))
+    return configs
+
+
+def _count_tokens(llm, text: str) -> int:
+    # Usa o tokenizer do próprio modelo quando disponível
+    pipeline = getattr(llm, "pipeline", None)
+    if pipeline is not None and getattr(pipeline, "tokenizer", None) is not None:
+        return len(pipeline.tokenizer.encode(text, add_special_tokens=False))
+    return llm.get_num_tokens(text)
+
+
+def benchmark_settings(settings: LLMSettings, runs: int = 3) -> BenchmarkResult:
+    """Carrega o LLM com a configuração dada e mede tokens gerados por segundo no prompt fixo."""
+    label = describe(settings)
+    try:
+        start = time.perf_counter()
+        llm = create_llm(settings)
+        load_seconds = time.perf_counter() - start
+
+        llm.invoke(BENCHMARK_PROMPT)  # Aquecimento (alocação de buffers, caches do runtime)
+        generated, elapsed = 0, 0.0
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = llm.invoke(BENCHMARK_PROMPT)
+            elapsed += time.perf_counter() - start
+            generated += _count_tokens(llm, getattr(output, "content", output))
+        return BenchmarkResult(label, "success", load_seconds, _count_tokens(llm, BENCHMARK_PROMPT),
+                               generated / runs, generated / elapsed if elapsed else 0.0, "")
+    except Exception as e:
+        logger.warning(f"Autoavaliação falhou para '{label}': {e}")
+        return BenchmarkResult(label, "error", 0.0, 0, 0, 0.0, str(e))
+
+
+def run_self_benchmark(spec: str, runs: int = 3):
+    """Executa a autoavaliação para cada configuração e registra o relatório no log, da mais rápida à mais lenta."""
+    results = [benchmark_settings(settings, runs) for settings in parse_benchmark_configs(spec, load_settings())]
+    results.sort(key=lambda r: r.tokens_per_second, reverse=True)
+    logger.info("Autoavaliação de inferência (tokens/s gerados, do mais rápido ao mais lento):")
+    for r in results:
+        if r.status == "success":
+            logger.info(f"  {r.tokens_per_second:8.2f} tok/s | carga {r.load_seconds:6.1f}s | "
+                        f"prompt {r.prompt_tokens} tok | {r.label}")
+        else:
+            logger.info(f"  {'falhou':>8}       | {r.label}: {r.message}")
+    return results
@@ -0,0 +1,65 @@
+# app/llm_stub.py
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Modelo de chat falso que reproduz chamadas de ferramenta e SQL pré-gravados.
+
+    Serve para executar o agente SQL sem HF_TOKEN, GPU ou modelo GGUF (benchmarks e testes offline).
+    O roteiro mapeia cada pergunta para uma lista de queries SQL e um modelo de resposta final;
+    a resposta final pode usar `{observation}` para incluir o resultado da última query.
+    O modelo não guarda estado entre chamadas: o passo atual é deduzido das mensagens recebidas,
+    portanto uma mesma instância pode ser compartilhada entre requisições concorrentes.
+    """
+
+    script: Dict[str, Dict[str, Any]]
+    default_answer: str = "Não foi possível encontrar uma resposta."
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def get_num_tokens(self, text: str) -> int:
+        # Aproximação por palavras: o modelo falso não tem tokenizer
+        return len(text.split())
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        # As ferramentas são ignoradas: as chamadas já estão no roteiro
+        return self
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # A pergunta é a última mensagem humana; as mensagens de ferramenta seguintes indicam o passo atual
+        question, observations = "", []
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                question, observations = str(message.content), []
+            elif isinstance(message, ToolMessage):
+                observations.append(str(message.content))
+
+        entry = self.script.get(question.strip())
+        if entry is None:
+            message = AIMessage(content=self.default_answer)
+        else:
+            queries = entry.get("sql", [])
+            step = len(observations)
+            if step < len(queries):
+                message = AIMessage(
+                    content="",
+                    tool_calls=[{"name": "sql_db_query", "args": {"query": queries[step]}, "id": f"stub_{step}"}],
+                )
+            else:
+                last_observation = observations[-1] if observations else ""
+                message = AIMessage(content=entry.get("answer", "{observation}").format(observation=last_observation))
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
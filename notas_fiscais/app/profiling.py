@@ -0,0 +1,153 @@
+# app/profiling.py
+import cProfile
+import io
+import json
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from app.config import PROFILES_DIR
+from app.logger import logger
+
+# Perfil sob demanda de uma execução do ETL ou de uma consulta ao agente (CLI --profile, API X-Profile/profile).
+# Com o perfil ligado, a execução roda sob cProfile e cada etapa marcada com profile_stage() ganha um snapshot
+# do tracemalloc. Os arquivos ficam em PROFILES_DIR/<id>/:
+#   summary.json       tempo e memória por etapa
+#   profile.prof       estatísticas do cProfile (abrir com snakeviz, pstats ou gprof2dot)
+#   profile.txt        as funções com maior tempo cumulativo
+#   memory_<n>_<etapa>.txt  linhas de código que mais alocaram memória na etapa
+# Com o perfil desligado, profile_stage() devolve um nullcontext: nenhum profiler ou rastreamento é ativado.
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}-[0-9]{6}-[a-z]+-[0-9a-f]{8}$")
+TOP_FUNCTIONS = 60  # Funções listadas em profile.txt
+TOP_ALLOCATIONS = 25  # Linhas listadas em cada memory_<n>_<etapa>.txt
+
+_current_session: ContextVar = ContextVar("profile_session", default=None)
+# cProfile e tracemalloc são globais ao processo: um perfil por vez
+_session_lock = threading.Lock()
+_NULL_STAGE = nullcontext()
+
+
+class ProfileSession:
+    """Perfil de uma execução: cProfile da thread atual e tracemalloc por etapa."""
+
+    def __init__(self, kind: str, label: str = ""):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{uuid.uuid4().hex[:8]}"
+        self.kind = kind
+        self.label = label
+        self.dir = PROFILES_DIR / self.id
+        self.stages = []
+        self._profiler = cProfile.Profile()
+        self._started = None
+
+    def start(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tracemalloc.start()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        self._profiler.disable()
+        total = time.perf_counter() - self._started
+        tracemalloc.stop()
+
+        self._profiler.dump_stats(str(self.dir / "profile.prof"))
+        stream = io.StringIO()
+        pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        (self.dir / "profile.txt").write_text(stream.getvalue(), encoding="utf-8")
+
+        summary = {
+            "id": self.id,
+            "kind": self.kind,
+            "label": self.label,
+            "total_seconds": round(total, 4),
+            "stages": self.stages,
+            "files": sorted(p.name for p in self.dir.iterdir()) + ["summary.json"],
+        }
+        (self.dir / "summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"Perfil '{self.id}' gravado em {self.dir} ({total:.2f}s, {len(self.stages)} etapa(s)).")
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mede tempo e memória de uma etapa e grava as linhas que mais alocaram nela."""
+        before = _take_snapshot()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = _take_snapshot()
+            index = len(self.stages) + 1
+            lines = [f"Etapa '{name}': maiores variações de memória por linha (top {TOP_ALLOCATIONS})"]
+            lines += [str(stat) for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]]
+            safe_name = re.sub(r"\W+", "_", name)
+            (self.dir / f"memory_{index}_{safe_name}.txt").write_text("\n".join(lines), encoding="utf-8")
+            self.stages.append({
+                "name": name,
+                "seconds": round(seconds, 4),
+                "memory_delta_mb": round((current - start_memory) / 2 ** 20, 3),
+                "memory_peak_mb": round(peak / 2 ** 20, 3),
+            })
+
+
+def _take_snapshot():
+    # Ignora as alocações do próprio tracemalloc (os snapshots anteriores)
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def profile_stage(name: str):
+    """
+    Marca uma etapa (ex.: "extract", "transform", "load") para o perfil em andamento.
+    Sem perfil ativo, retorna um nullcontext compartilhado: custo de uma leitura de ContextVar.
+    """
+    session = _current_session.get()
+    return session.stage(name) if session is not None else _NULL_STAGE
+
+
+def run_profiled(kind: str, label: str, func, *args, **kwargs):
+    """
+    Executa func(*args, **kwargs) com perfil ligado e retorna (resultado, id do perfil).
+    Deve ser chamada na thread que executa o trabalho (o cProfile só observa a thread em que foi ligado).
+    Perfis simultâneos são serializados; alocações de outras requisições em paralelo entram no tracemalloc.
+    Processos filhos (ex.: leitura paralela de XMLs) não aparecem no cProfile.
+    """
+    with _session_lock:
+        session = ProfileSession(kind, label)
+        token = _current_session.set(session)
+        session.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            session.stop()
+            _current_session.reset(token)
+    return result, session.id
+
+
+def list_profiles() -> list:
+    """Retorna os resumos (summary.json) dos perfis gravados, do mais recente para o mais antigo."""
+    summaries = []
+    for summary_file in sorted(PROFILES_DIR.glob("*/summary.json"), reverse=True):
+        try:
+            summaries.append(json.loads(summary_file.read_text(encoding="utf-8")))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Resumo de perfil ilegível: {summary_file}: {e}")
+    return summaries
+
+
+def get_profile_file(profile_id: str, file_name: str) -> Path:
+    """Retorna o caminho de um arquivo de perfil, ou levanta FileNotFoundError (ids e nomes são validados)."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise FileNotFoundError(f"Perfil inválido: '{profile_id}'.")
+    profile_dir = PROFILES_DIR / profile_id
+    # Só nomes existentes no diretório do perfil: impede acesso a caminhos fora dele
+    if not profile_dir.is_dir() or file_name not in {p.name for p in profile_dir.iterdir()}:
+        raise FileNotFoundError(f"Arquivo '{file_name}' não encontrado no perfil '{profile_id}'.")
+    return profile_dir / file_name
@@ -1,112 +1,111 @@
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from typing import TYPE_CHECKING
 import pandas as pd
-from langchain.agents import create_sql_agent
-# Importa componentes específicos da LangChain para LLMs e utilitários de banco de dados
-from langchain_community.llms import HuggingFacePipeline, LlamaCpp
-from langchain_community.utilities import SQLDatabase
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_core.prompts import ChatPromptTemplate
-# Importa pipeline do Transformers para modelos Hugging Face
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM  # Adicionado AutoTokenizer, AutoModelForCausalLM
 # Importa variáveis de configuração e logger do diretório 'app' usando importação absoluta
-from app.config import DB_PATH, ENV, LLM_CLOUD_MODEL_NAME, HF_TOKEN
+from app.config import (
+    AGENT_MAX_EXECUTION_TIME, AGENT_MAX_ITERATIONS, AGENT_MAX_RESULT_ROWS, AGENT_MAX_SCAN_ROWS,
+    DB_PATH, MAX_ACTIVE_DATASETS, get_db_path,
+)
+from app.database import FTS_TABLE, get_data_version, get_fts_columns, reader_uri
+from app.llm_backends import create_llm, load_settings
 from app.logger import logger
+from app.profiling import profile_stage
 import os
-from huggingface_hub import login  # Adicionado para login explícito
+import sqlite3
+import threading
+from pathlib import Path
+
+# LangChain e as bibliotecas dos backends de LLM são importados dentro das funções que os usam,
+# para que a CLI de ETL e o boot da API não paguem o custo dessas importações.
+if TYPE_CHECKING:
+    from langchain_community.utilities import SQLDatabase
+    from langchain_core.prompts import ChatPromptTemplate
 
 # Define um namedtuple para padronizar o resultado das consultas
-QueryResult = namedtuple("QueryResult", ["data", "status", "message"])
+# stats: iterações do agente, chamadas ao LLM e tokens gastos na pergunta (None quando o agente não rodou)
+QueryResult = namedtuple("QueryResult", ["data", "status", "message", "stats"], defaults=(None,))
+
+# Agente pronto para uso: versão dos dados para a qual foi construído, banco (engine com pool) e executor
+AgentBundle = namedtuple("AgentBundle", ["version", "db", "executor"])
 
 # Variável global para armazenar a instância do LLM (cache)
 _llm_instance = None
+_llm_lock = threading.Lock()  # Evita carregar o modelo mais de uma vez em requisições simultâneas
+
+# Cache LRU de agentes por caminho de banco (um por dataset ativo); cada agente é reconstruído
+# apenas quando a versão dos dados muda e o menos usado é descartado ao exceder MAX_ACTIVE_DATASETS
+_agent_cache = OrderedDict()
+_agent_lock = threading.Lock()  # Protege o dicionário do cache (operações rápidas)
+# Um lock de construção por banco (datasets diferentes são construídos em paralelo): chave -> [lock, threads
+# usando]. O lock existe só enquanto alguma thread constrói ou espera a construção daquele banco.
+_build_locks = {}
 
 
 def get_llm():
+    """Retorna o LLM em cache, carregando-o no primeiro uso com o backend configurado (app/llm_backends.py)."""
     global _llm_instance
     if _llm_instance is not None:
-        logger.info("Retornando LLM do cache.")
         return _llm_instance
 
-    if ENV == "cloud":
-        logger.info(f"Carregando LLM da nuvem: {LLM_CLOUD_MODEL_NAME}")
-        try:
-            if not HF_TOKEN:
-                raise ValueError("HF_TOKEN não definido. Necessário para acessar modelos Hugging Face na nuvem.")
-
-            # Autentica no Hugging Face Hub (mesmo para modelos públicos, para evitar rate limits)
-            login(token=HF_TOKEN)
-
-            # Inicializa o tokenizer e o modelo para geração de texto
-            # Usar AutoModelForCausalLM.from_pretrained com device_map="auto" para melhor uso de recursos
-            tokenizer = AutoTokenizer.from_pretrained(LLM_CLOUD_MODEL_NAME, trust_remote_code=True)
-            model = AutoModelForCausalLM.from_pretrained(
-                LLM_CLOUD_MODEL_NAME,
-                trust_remote_code=True,
-                device_map="auto",  # Permite que transformers use CPU/GPU automaticamente
-            )
-
-            # Cria um pipeline de geração de texto com o modelo carregado
-            pipe = pipeline(
-                "text-generation",
-                model=model,
-                tokenizer=tokenizer,
-                max_new_tokens=512,  # Limita o número de novos tokens gerados
-                temperature=0.01,  # Controla a aleatoriedade da saída (valores menores para mais determinismo)
-                do_sample=True,  # Permite amostragem para diversidade
-                top_k=50,  # Considera apenas os 50 tokens mais prováveis
-                num_return_sequences=1,  # Retorna apenas uma sequência gerada
-                # device=-1 foi removido para deixar device_map="auto" decidir
-            )
-            _llm_instance = HuggingFacePipeline(pipeline=pipe)  # Cache a instância
+    with _llm_lock:
+        if _llm_instance is not None:  # Outra thread pode ter carregado o modelo enquanto esperávamos
             return _llm_instance
-        except Exception as e:
-            logger.error(f"Erro ao carregar LLM da nuvem: {e}", exc_info=True)
-            raise RuntimeError(f"Falha ao carregar LLM da nuvem: {e}. Verifique LLM_CLOUD_MODEL_NAME e HF_TOKEN.")
-    else:
-        logger.info(f"Carregando LLM local: {LLM_LOCAL_MODEL_PATH}")
-        if not LLM_LOCAL_MODEL_PATH.exists():
-            raise FileNotFoundError(f"Modelo local não encontrado em {LLM_LOCAL_MODEL_PATH}. "
-                                    f"Certifique-se de baixar o modelo ou ajustar LLM_LOCAL_MODEL_PATH.")
+        settings = load_settings()
         try:
-            # Inicializa o modelo LlamaCpp para inferência local
-            _llm_instance = LlamaCpp(  # Cache a instância
-                model_path=str(LLM_LOCAL_MODEL_PATH),
-                temperature=0.01,  # Controla a aleatoriedade
-                max_tokens=256,  # Limite de tokens na resposta
-                top_p=0.9,  # Amostragem de núcleo
-                n_ctx=2048,  # Tamanho do contexto (número máximo de tokens de entrada)
-                n_gpu_layers=0,  # Número de camadas a descarregar na GPU (0 para CPU)
-                verbose=False  # Desativa logs verbosos do LlamaCpp
-            )
+            _llm_instance = create_llm(settings)  # Cache a instância
             return _llm_instance
         except Exception as e:
-            logger.error(f"Erro ao carregar LLM local: {e}", exc_info=True)
-            raise RuntimeError(f"Falha ao carregar LLM local: {e}. Verifique model_path e dependências.")
+            logger.error(f"Erro ao carregar LLM ({settings.backend}): {e}", exc_info=True)
+            raise RuntimeError(f"Falha ao carregar LLM ({settings.backend}): {e}. "
+                               f"Verifique LLM_BACKEND, o modelo configurado e as dependências.")
 
 
-def query_data(question: str) -> QueryResult:
-    """
-    Executa uma consulta em linguagem natural usando um agente de IA baseado em SQL.
-    O agente interage com um banco de dados SQLite para obter as respostas.
-    """
-    logger.info(f"Consulta recebida para o agente: '{question}'")
-    try:
-        # Tenta obter uma instância do LLM (local ou cloud)
-        llm = get_llm()
+def set_llm(llm) -> None:
+    """Substitui a instância do LLM em cache (ex.: StubChatModel para benchmarks sem GPU ou rede)."""
+    global _llm_instance
+    _llm_instance = llm
+    clear_agent_cache()  # Os executores em cache foram construídos com o LLM anterior
 
-        # Conecta ao banco de dados SQLite
-        db = SQLDatabase.from_uri(f"sqlite:///{DB_PATH}")
-        # Obtém o esquema da tabela (importante para o agente entender a estrutura)
-        table_info = db.get_table_info()
 
-        if not table_info:
-            logger.error("Banco de dados vazio ou sem esquema detectado.")
-            return QueryResult(pd.DataFrame(), "error",
-                               "Banco de dados vazio ou sem esquema. Carregue os dados primeiro.")
+def build_database(db_path: Path = DB_PATH) -> "SQLDatabase":
+    """Conecta ao banco SQLite e reflete o esquema das tabelas."""
+    from langchain_community.utilities import SQLDatabase
+
+    # Engine com pool de conexões compartilhado entre requisições (check_same_thread=False para uso em threads).
+    # Apenas `notas_fiscais` entra no esquema: as tabelas internas do índice FTS não interessam ao agente.
+    # O banco publicado nunca é alterado (cargas substituem o arquivo, ver ShadowLoad), então as conexões
+    # são somente leitura e imutáveis: sem locks, cada conexão lê o arquivo que estava publicado ao abrir.
+    # As conexões são abertas com a URI de reader_uri (creator): o SQLAlchemy decodifica o caminho de uma URL
+    # "sqlite:///file:...", o que quebraria caminhos com "#", "?" ou "%".
+    from sqlalchemy.pool import QueuePool
 
-        # Define o prompt para o agente de IA, instruindo-o sobre seu papel e as regras
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=f"""Você é um assistente de IA útil e analista de dados, especializado em notas fiscais. 
+    uri = reader_uri(db_path)
+    return SQLDatabase.from_uri(
+        "sqlite://",
+        include_tables=["notas_fiscais"],
+        engine_args={
+            "creator": lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+            "poolclass": QueuePool, "pool_size": 5, "max_overflow": 10,
+        },
+    )
+
+
+def build_prompt(table_info: str, fts_columns=()) -> "ChatPromptTemplate":
+    """Monta o prompt do agente com o esquema da tabela embutido (e a regra de busca textual, se houver índice FTS)."""
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    text_search_rule = ""
+    if fts_columns:
+        text_search_rule = (
+            f"\n8. Para buscar palavras nas colunas {', '.join(fts_columns)} não use LIKE: filtre com "
+            f"`rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH 'palavra1 palavra2')` "
+            f"(ignora maiúsculas e acentos) ou use a ferramenta sql_db_text_search para ver os valores existentes."
+        )
+
+    # Define o prompt para o agente de IA, instruindo-o sobre seu papel e as regras
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=f"""Você é um assistente de IA útil e analista de dados, especializado em notas fiscais. 
 Use SQL baseado no esquema do banco de dados abaixo para responder às perguntas sobre a tabela `notas_fiscais`.
 
 Esquema da Tabela `notas_fiscais`:
@@ -119,40 +118,169 @@ Regras para sua resposta:
 4. Se não houver dados relevantes, ou se a pergunta for impossível de responder com os dados fornecidos, diga "Não foi possível encontrar uma resposta" ou "Não tenho informações sobre isso".
 5. Nunca mostre a query SQL gerada ou qualquer código. Apenas a resposta final.
 6. Apresente os resultados de forma legível e formatada, se aplicável (ex: listar itens, valores, etc.).
-7. Se a pergunta for sobre um valor monetário, formate a resposta com duas casas decimais e o símbolo "R$".
+7. Se a pergunta for sobre um valor monetário, formate a resposta com duas casas decimais e o símbolo "R$".{text_search_rule}
 """),
-            HumanMessage(content="{input}")  # A pergunta do usuário será injetada aqui
-        ])
-
-        # Cria o agente SQL.
-        # "openai-tools" é um tipo de agente que funciona bem com LLMs que podem usar ferramentas.
-        # verbose=False para não mostrar o processo interno do agente (queries SQL, etc.)
-        # handle_parsing_errors=True para que o agente tente se recuperar de erros de parsing.
-        agent_executor = create_sql_agent(
-            llm=llm,
-            db=db,
-            agent_type="openai-tools",  # Pode ser "zero-shot-react-description" ou outros também
-            verbose=False,
-            handle_parsing_errors=True,
-            prompt=prompt
-        )
+        ("human", "{input}"),  # A pergunta do usuário será injetada aqui
+        MessagesPlaceholder(variable_name="agent_scratchpad"),  # Chamadas de ferramenta e resultados do agente
+    ])
+
+
+def build_agent(llm, db: "SQLDatabase", prompt: "ChatPromptTemplate", fts_columns=()):
+    """
+    Cria o executor do agente SQL com ferramentas enxutas: consulta com LIMIT e resultado compacto,
+    esquema das tabelas e, quando o banco tem índice FTS, busca textual.
+    """
+    from langchain_community.agent_toolkits.sql.base import create_sql_agent
+    from app.query_tools import CompactSQLDatabaseToolkit, TextSearchTool
+
+    toolkit = CompactSQLDatabaseToolkit(db=db, llm=llm, max_rows=AGENT_MAX_RESULT_ROWS,
+                                        max_scan_rows=AGENT_MAX_SCAN_ROWS)
+    extra_tools = [TextSearchTool(db=db, fts_columns=list(fts_columns))] if fts_columns else []
+
+    # "openai-tools" é um tipo de agente que funciona bem com LLMs que podem usar ferramentas.
+    # verbose=False para não mostrar o processo interno do agente (queries SQL, etc.)
+    # handle_parsing_errors=True para que o agente tente se recuperar de erros de parsing.
+    # max_iterations/max_execution_time limitam o custo de cada pergunta; ao atingir o limite o agente
+    # para ("force") e query_data usa o último resultado obtido como resposta parcial.
+    return create_sql_agent(
+        llm=llm,
+        toolkit=toolkit,
+        agent_type="openai-tools",  # Pode ser "zero-shot-react-description" ou outros também
+        verbose=False,
+        handle_parsing_errors=True,
+        prompt=prompt,
+        extra_tools=extra_tools,
+        max_iterations=AGENT_MAX_ITERATIONS,
+        max_execution_time=AGENT_MAX_EXECUTION_TIME,
+        early_stopping_method="force",
+        agent_executor_kwargs={"return_intermediate_steps": True},
+    )
+
+
+def format_answer(final_answer: str, stats: dict = None) -> QueryResult:
+    """Classifica a resposta final do agente e a empacota em um QueryResult."""
+    status = "success"  # Status inicial como sucesso
 
-        # Invoca o agente com a pergunta do usuário
-        agent_response = agent_executor.invoke({"input": question})
+    # Verifica se a resposta do agente indica que não encontrou ou houve um problema
+    if any(term in final_answer.lower() for term in
+           ["não foi possível encontrar uma resposta", "não tenho informações", "erro", "não encontrei",
+            "não sei"]):
+        status = "warning" if "não" in final_answer.lower() else "error"
+
+    # Retorna a resposta em um DataFrame (mesmo que seja uma string única) para consistência
+    df = pd.DataFrame({"Resposta": [final_answer]})
+    return QueryResult(df, status, final_answer, stats)
+
+
+def get_agent(db_path: Path = DB_PATH):
+    """
+    Retorna o agente em cache para o banco, reconstruindo-o (engine, reflexão do esquema, prompt e executor)
+    somente quando a versão dos dados muda. Retorna None se o banco não existe ou não tem esquema.
+    O executor não guarda estado entre invocações e pode ser compartilhado entre requisições concorrentes.
+    """
+    key = str(db_path)
+    version = get_data_version(db_path)
+    with _agent_lock:
+        bundle = _agent_cache.get(key)
+        if bundle is not None and bundle.version == version:
+            _agent_cache.move_to_end(key)
+            return bundle
+        build_entry = _build_locks.setdefault(key, [threading.Lock(), 0])
+        build_entry[1] += 1
+
+    try:
+        with build_entry[0]:
+            return _build_agent(key, db_path, version)
+    finally:
+        with _agent_lock:
+            build_entry[1] -= 1
+            if build_entry[1] == 0:
+                del _build_locks[key]
+
+
+def _build_agent(key: str, db_path: Path, version):
+    """Constrói o agente do banco e o coloca no cache. Chamada com o lock de construção do banco."""
+    # Outra thread pode ter reconstruído o agente enquanto esperávamos o lock
+    with _agent_lock:
+        bundle = _agent_cache.get(key)
+        if bundle is not None and bundle.version == version:
+            _agent_cache.move_to_end(key)
+            return bundle
+        if bundle is not None:
+            logger.info(f"Versão dos dados de {db_path} mudou. Reconstruindo o agente.")
+            _agent_cache.pop(key)
+            bundle.db._engine.dispose()  # Conexões em uso são fechadas ao serem devolvidas ao pool
+    if version is None:
+        return None
+
+    llm = get_llm()
+    try:
+        db = build_database(db_path)
+    except ValueError:  # Banco existe mas ainda não tem a tabela notas_fiscais
+        return None
+    # Obtém o esquema da tabela (importante para o agente entender a estrutura)
+    table_info = db.get_table_info()
+    if not table_info:
+        db._engine.dispose()
+        return None
+
+    fts_columns = get_fts_columns(db_path)
+    executor = build_agent(llm, db, build_prompt(table_info, fts_columns), fts_columns)
+    bundle = AgentBundle(version=version, db=db, executor=executor)
+    with _agent_lock:
+        _agent_cache[key] = bundle
+        while len(_agent_cache) > MAX_ACTIVE_DATASETS:
+            evicted_key, evicted = _agent_cache.popitem(last=False)
+            evicted.db._engine.dispose()
+            logger.info(f"Agente de {evicted_key} descartado do cache (LRU).")
+    logger.info(f"Agente construído e armazenado em cache para {db_path}.")
+    return bundle
+
+
+def clear_agent_cache() -> None:
+    """Descarta todos os agentes em cache e fecha os pools de conexão."""
+    with _agent_lock:
+        for bundle in _agent_cache.values():
+            bundle.db._engine.dispose()
+        _agent_cache.clear()
+
+
+def query_data(question: str, dataset: str = None) -> QueryResult:
+    """
+    Executa uma consulta em linguagem natural usando um agente de IA baseado em SQL.
+    O agente interage com um banco de dados SQLite para obter as respostas.
+    Com `dataset`, o agente enxerga apenas o banco daquele dataset/cliente.
+    """
+    logger.info(f"Consulta recebida para o agente: '{question}' (dataset: {dataset or 'padrão'})")
+    try:
+        # Obtém o agente em cache (LLM, engine do banco e executor), reconstruído só se os dados mudaram
+        with profile_stage("agent_setup"):
+            bundle = get_agent(get_db_path(dataset))
+
+        if bundle is None:
+            logger.error("Banco de dados vazio ou sem esquema detectado.")
+            return QueryResult(pd.DataFrame(), "error",
+                               "Banco de dados vazio ou sem esquema. Carregue os dados primeiro.")
+
+        from app.query_tools import AgentStatsHandler
+
+        # Invoca o agente com a pergunta do usuário, contando iterações e tokens
+        stats_handler = AgentStatsHandler()
+        with profile_stage("agent_run"):
+            agent_response = bundle.executor.invoke({"input": question}, config={"callbacks": [stats_handler]})
         # Extrai a resposta final do agente. Pode ser 'output' ou a representação string.
         final_answer = agent_response.get("output", str(agent_response))
-        status = "success"  # Status inicial como sucesso
-
-        # Verifica se a resposta do agente indica que não encontrou ou houve um problema
-        if any(term in final_answer.lower() for term in
-               ["não foi possível encontrar uma resposta", "não tenho informações", "erro", "não encontrei",
-                "não sei"]):
-            status = "warning" if "não" in final_answer.lower() else "error"
-
-        # Retorna a resposta em um DataFrame (mesmo que seja uma string única) para consistência
-        df = pd.DataFrame({"Resposta": [final_answer]})
-        logger.info(f"Consulta finalizada. Status: {status}, Mensagem: {final_answer[:100]}...")  # Log da resposta
-        return QueryResult(df, status, final_answer)
+
+        steps = agent_response.get("intermediate_steps") or []
+        if final_answer.startswith("Agent stopped") and steps:
+            # Limite de iterações/tempo atingido: responde com o último resultado em vez de descartá-lo
+            final_answer = (f"Não foi possível encontrar uma resposta completa dentro do limite de iterações/tempo. "
+                            f"Último resultado obtido:\n{steps[-1][1]}")
+
+        result = format_answer(final_answer, stats_handler.as_dict())
+        logger.info(f"Consulta finalizada. Status: {result.status}, Estatísticas: {result.stats}, "
+                    f"Mensagem: {final_answer[:100]}...")  # Log da resposta
+        return result
 
     except Exception as e:
         logger.error(f"Erro inesperado durante a consulta ao agente: {e}", exc_info=True)
@@ -0,0 +1,193 @@
+# app/query_tools.py
+import re
+from typing import Any, Dict, List, Optional
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import BaseSQLDatabaseTool, InfoSQLDatabaseTool
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import FTS_TABLE
+
+# Ferramentas e callbacks do agente SQL. Este módulo importa LangChain no topo e por isso
+# só deve ser importado dentro das funções que constroem o agente (ver app/query.py).
+
+
+def build_match_expression(terms: str) -> str:
+    """
+    Converte palavras livres em uma expressão MATCH do FTS5 segura: cada palavra vira um termo
+    entre aspas com busca por prefixo, todos obrigatórios (ex.: 'papel a4' -> '"papel"* "a4"*').
+    """
+    words = re.findall(r"\w+", terms)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class TextSearchTool(BaseSQLDatabaseTool, BaseTool):
+    """Busca por palavras nas colunas de texto indexadas (descrições e nomes) usando o índice FTS5."""
+
+    name: str = "sql_db_text_search"
+    description: str = (
+        "Busca palavras em descrições de itens e nomes de emitente/destinatário usando o índice de texto "
+        "(ignora maiúsculas e acentos). Entrada: as palavras a buscar, ex.: 'papel a4'. Retorna, por coluna, "
+        "os valores encontrados e quantas linhas têm cada um. Para filtrar numa consulta SQL use "
+        f"`rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH '<palavras>')` em vez de LIKE."
+    )
+    fts_columns: List[str]
+    table_name: str = "notas_fiscais"
+    max_values: int = 10
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        expression = build_match_expression(query)
+        if not expression:
+            return "Informe ao menos uma palavra para buscar."
+
+        lines = []
+        with self.db._engine.connect() as conn:
+            for column in self.fts_columns:
+                rows = conn.execute(text(
+                    f"SELECT {column}, COUNT(*) FROM {self.table_name} WHERE rowid IN "
+                    f"(SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match) "
+                    f"GROUP BY {column} ORDER BY COUNT(*) DESC LIMIT :limit"
+                ), {"match": f"{column} : ({expression})", "limit": self.max_values}).fetchall()
+                if rows:
+                    lines.append(f"{column}: " + "; ".join(f"{value} ({count} linhas)" for value, count in rows))
+        if not lines:
+            return f"Nenhum resultado para '{query}'."
+        return "\n".join(lines)
+
+
+def format_compact(columns: List[str], rows: List[tuple], max_rows: int, max_scan_rows: int) -> str:
+    """
+    Formata o resultado de uma consulta de forma compacta para o contexto do LLM: colunas alinhadas,
+    números arredondados, apenas as primeiras `max_rows` linhas e um resumo das demais.
+    `rows` pode ter até max_scan_rows + 1 linhas; a linha extra indica que o resultado foi cortado.
+    """
+    if not rows:
+        return "Nenhuma linha retornada."
+
+    scan_truncated = len(rows) > max_scan_rows
+    rows = rows[:max_scan_rows]
+
+    def cell(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        value = str(value)
+        return value if len(value) <= 60 else value[:57] + "..."
+
+    shown = [[cell(v) for v in row] for row in rows[:max_rows]]
+    widths = [max(len(str(col)), *(len(r[i]) for r in shown)) for i, col in enumerate(columns)]
+    lines = [" | ".join(str(col).ljust(w) for col, w in zip(columns, widths)).rstrip()]
+    lines += [" | ".join(v.ljust(w) for v, w in zip(r, widths)).rstrip() for r in shown]
+
+    if len(rows) > max_rows:
+        total = f"mais de {max_scan_rows}" if scan_truncated else str(len(rows))
+        summary = f"({total} linhas no total; mostrando as {max_rows} primeiras"
+        numeric = [i for i in range(len(columns))
+                   if all(isinstance(r[i], (int, float)) or r[i] is None for r in rows)]
+        if numeric:
+            sums = ", ".join(f"{columns[i]}={sum(r[i] or 0 for r in rows):.2f}" for i in numeric)
+            summary += f"; soma nas {len(rows)} linhas lidas: {sums}"
+        lines.append(summary + ". Prefira agregações (SUM, COUNT, GROUP BY) ou LIMIT.)")
+    return "\n".join(lines)
+
+
+class CompactQuerySQLTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Substitui a ferramenta sql_db_query padrão: aceita apenas SELECT, impõe um LIMIT à consulta
+    e devolve o resultado em formato compacto, para não inflar o contexto do LLM.
+    """
+
+    name: str = "sql_db_query"
+    description: str = (
+        "Executa uma consulta SQL SELECT no banco e retorna o resultado em forma de tabela compacta "
+        "(no máximo algumas linhas, com resumo do restante). Se a consulta estiver incorreta, um erro é "
+        "retornado: corrija a consulta e tente novamente."
+    )
+    max_rows: int = 20
+    max_scan_rows: int = 1000
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        sql = query.strip().rstrip(";").strip()
+        if not re.match(r"^(select|with)\b", sql, re.IGNORECASE):
+            return "Erro: apenas consultas SELECT são permitidas."
+
+        # O LIMIT externo vale para qualquer consulta, inclusive as que já têm LIMIT próprio
+        limited = f"SELECT * FROM ({sql}) LIMIT {self.max_scan_rows + 1}"
+        try:
+            with self.db._engine.connect() as conn:
+                result = conn.exec_driver_sql(limited)
+                columns = list(result.keys())
+                rows = [tuple(row) for row in result.fetchall()]
+        except SQLAlchemyError as e:
+            return f"Erro: {getattr(e, 'orig', None) or e}"
+        return format_compact(columns, rows, self.max_rows, self.max_scan_rows)
+
+
+class CompactSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """
+    Conjunto enxuto de ferramentas para o agente: consulta compacta e esquema das tabelas.
+    Remove o verificador de SQL (uma chamada extra ao LLM por consulta) e a listagem de tabelas
+    (o esquema já está no prompt).
+    """
+
+    max_rows: int = 20
+    max_scan_rows: int = 1000
+
+    def get_tools(self) -> List[BaseTool]:
+        return [
+            CompactQuerySQLTool(db=self.db, max_rows=self.max_rows, max_scan_rows=self.max_scan_rows),
+            InfoSQLDatabaseTool(db=self.db),
+        ]
+
+
+class AgentStatsHandler(BaseCallbackHandler):
+    """
+    Conta, para uma pergunta, as chamadas ao LLM, as iterações do agente (chamadas de ferramenta)
+    e os tokens de prompt/resposta. Usa a contagem informada pelo backend quando disponível e,
+    caso contrário, estima 1 token a cada 4 caracteres.
+    """
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.iterations = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._pending_prompt = 0  # Estimativa do prompt da chamada ao LLM em andamento
+
+    @staticmethod
+    def _estimate(text_value: str) -> int:
+        return max(1, len(text_value) // 4) if text_value else 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+        self._pending_prompt = sum(self._estimate(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+        self._pending_prompt = sum(self._estimate(p) for p in prompts)
+
+    def on_llm_end(self, response, **kwargs):
+        usage: Dict[str, Any] = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            return
+        self.prompt_tokens += self._pending_prompt
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                tool_calls = str(getattr(message, "tool_calls", "") or "")
+                self.completion_tokens += self._estimate(generation.text + tool_calls)
+
+    def on_agent_action(self, action, **kwargs):
+        self.iterations += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "iterations": self.iterations,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
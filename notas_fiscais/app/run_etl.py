@@ -1,28 +1,46 @@
 # Importa as funções das etapas do pipeline, usando importações absolutas dentro do pacote 'app'
 from app.extract import extract_zip
+from app.extract_xml import is_xml_archive, iter_xml_batches
 from app.transform import combine_data
-from app.database import save_to_database
+from app.database import ShadowLoad, save_to_database
+from app.profiling import profile_stage
 # Importa o logger e o diretório de entrada
 from app.logger import logger
-from app.config import INPUT_DIR
+from app.config import INPUT_DIR, XML_WORKERS, get_db_path
 
-def run_etl_pipeline(file_name: str) -> bool:
+def run_etl_pipeline(file_name: str, dataset: str = None, xml_workers: int = XML_WORKERS) -> bool:
     """
     Executa o pipeline completo de ETL (Extract, Transform, Load) para um arquivo ZIP.
 
     Args:
         file_name (str): O nome do arquivo ZIP a ser processado, localizado em INPUT_DIR.
+        dataset (str): Identificador do dataset/cliente de destino. Sem dataset, usa o banco padrão (DB_PATH).
+        xml_workers (int): Processos de leitura para ZIPs de XMLs de NF-e (ver run_xml_pipeline).
 
     Returns:
         bool: True se o pipeline for concluído com sucesso, False caso contrário.
     """
     file_path = INPUT_DIR / file_name
-    logger.info(f"Iniciando pipeline ETL para o arquivo: {file_path.name}")
+    try:
+        db_path = get_db_path(dataset)
+    except ValueError as e:
+        logger.error(str(e))
+        return False
+    logger.info(f"Iniciando pipeline ETL para o arquivo: {file_path.name} (banco: {db_path.name})")
+
+    try:
+        xml_archive = is_xml_archive(file_path)
+    except Exception as e:
+        logger.error(f"Falha ao abrir o arquivo {file_path.name}: {e}", exc_info=True)
+        return False
+    if xml_archive:
+        return run_xml_pipeline(file_path, db_path, xml_workers)
 
     # ETAPA 1: EXTRAÇÃO
     try:
         logger.info(f"Iniciando etapa de extração para {file_path.name}")
-        extract_result = extract_zip(file_path) # Extrai os CSVs do ZIP para DataFrames
+        with profile_stage("extract"):
+            extract_result = extract_zip(file_path) # Extrai os CSVs do ZIP para DataFrames
         # Verifica se os DataFrames resultantes da extração estão vazios
         if extract_result.cabecalho.empty or extract_result.itens.empty:
             logger.error(f"Extração de {file_path.name} resultou em DataFrames vazios ou incompletos.")
@@ -37,7 +55,8 @@ def run_etl_pipeline(file_name: str) -> bool:
     try:
         logger.info(f"Iniciando etapa de transformação para {file_path.name}")
         # Combina os DataFrames de cabeçalho e itens
-        transform_result = combine_data(extract_result.cabecalho, extract_result.itens)
+        with profile_stage("transform"):
+            transform_result = combine_data(extract_result.cabecalho, extract_result.itens)
         # Verifica o status e se o DataFrame combinado não está vazio
         if not transform_result.status.startswith("success") or transform_result.combined_df.empty:
             logger.error(f"Falha na etapa de transformação para {file_path.name}: {transform_result.message}")
@@ -50,7 +69,8 @@ def run_etl_pipeline(file_name: str) -> bool:
     try:
         logger.info(f"Iniciando etapa de carregamento (load) para {file_path.name}")
         # Salva o DataFrame combinado no banco de dados
-        database_result = save_to_database(transform_result.combined_df)
+        with profile_stage("load"):
+            database_result = save_to_database(transform_result.combined_df, db_path)
         # Verifica o status do salvamento no banco de dados
         if not database_result.status.startswith("success"):
             logger.error(f"Falha ao salvar dados de {file_path.name} no banco de dados: {database_result.message}")
@@ -60,4 +80,38 @@ def run_etl_pipeline(file_name: str) -> bool:
         return True # Pipeline ETL concluído com sucesso
     except Exception as e:
         logger.error(f"Falha crítica na etapa de carregamento (load) para {file_path.name}: {e}", exc_info=True)
-        return False # Falha no carregamento
\ No newline at end of file
+        return False # Falha no carregamento
+
+
+def run_xml_pipeline(file_path, db_path, xml_workers: int = XML_WORKERS) -> bool:
+    """
+    Pipeline ETL para ZIPs de XMLs de NF-e: cada lote de XMLs lido (ver app/extract_xml.py) passa pela
+    transformação e é acrescentado ao banco sombra; o banco só é publicado depois do último lote.
+    Como cada XML traz a nota inteira (cabeçalho e itens), a junção por lote é equivalente à junção total.
+    Os XMLs são lidos por `xml_workers` processos (o serviço de ingestão divide XML_WORKERS entre os seus).
+    """
+    logger.info(f"Arquivo {file_path.name} contém XMLs de NF-e. Processando em lotes.")
+    try:
+        with ShadowLoad(db_path) as load:
+            with profile_stage("extract_transform_load"):
+                batches = iter_xml_batches(file_path, workers=xml_workers)
+                for batch_number, extract_result in enumerate(batches, start=1):
+                    if extract_result.cabecalho.empty:
+                        continue  # Lote só com XMLs ignorados
+                    transform_result = combine_data(extract_result.cabecalho, extract_result.itens)
+                    if not transform_result.status.startswith("success"):
+                        logger.error(f"Falha na transformação do lote {batch_number} de {file_path.name}: "
+                                     f"{transform_result.message}")
+                        return False
+                    load.append(transform_result.combined_df)
+
+            if load.rows == 0:
+                logger.error(f"Nenhuma NF-e válida encontrada em {file_path.name}.")
+                return False
+            with profile_stage("publish"):
+                load.publish()
+        logger.info(f"Pipeline ETL para {file_path.name} concluído com sucesso ({load.rows} registros).")
+        return True
+    except Exception as e:
+        logger.error(f"Falha crítica no pipeline de XMLs para {file_path.name}: {e}", exc_info=True)
+        return False
@@ -1,4 +1,5 @@
 from collections import namedtuple
+import numpy as np
 import pandas as pd
 # Importa o logger do diretório 'app' usando importação absoluta
 from app.logger import logger
@@ -7,6 +8,116 @@ from app.logger import logger
 TransformResult = namedtuple("TransformResult", ["combined_df", "status", "message"])
 
 
+def _normalize_keys(values, dtype) -> np.ndarray:
+    """str + strip de valores de chave distintos (mesmo resultado de astype(str).str.strip())."""
+    as_text = pd.Series(values, dtype=dtype).astype(str).to_numpy(dtype=object)
+    # str.strip devolve o próprio objeto quando não há espaços: chaves já limpas não são copiadas
+    return np.array([value.strip() for value in as_text], dtype=object)
+
+
+def _factorize_normalized(values: pd.Series):
+    """
+    Fatora os valores já normalizados (str + strip), normalizando só os valores distintos.
+    Retorna (códigos por linha, chaves normalizadas distintas).
+    """
+    codes, uniques = pd.factorize(values)  # Valores ausentes recebem -1
+    keys = _normalize_keys(uniques, values.dtype)
+    changed = not (keys == uniques.to_numpy(dtype=object)).all()
+    missing = codes == -1
+    if missing.any():
+        # factorize junta None, NaN e pd.NA; astype(str) os distingue ("None", "nan", "<NA>"), então as linhas
+        # com valor ausente são normalizadas uma a uma
+        codes[missing] = len(keys) + np.arange(missing.sum())
+        keys = np.concatenate([keys, _normalize_keys(values[missing], values.dtype)])
+    if changed or missing.any():
+        # A normalização pode ter juntado valores antes distintos (ex.: "1" e " 1", ou None e "None")
+        normalized_codes, keys = pd.factorize(keys)
+        codes = normalized_codes[codes]
+    return codes, keys
+
+
+def factorize_keys(left: pd.Series, right: pd.Series):
+    """
+    Normaliza as chaves de junção dos dois lados (str + strip, como antes) e as converte em códigos inteiros
+    de uma fatoração compartilhada. A normalização é feita só sobre valores distintos, não linha a linha:
+    as chaves do cabeçalho são fatoradas e normalizadas uma vez, e as dos itens são procuradas diretamente
+    nesse índice; só as que não forem encontradas (ex.: com espaços, numéricas ou ausentes) passam pela
+    normalização. Valores ausentes seguem o astype(str): None vira "None" e NaN vira "nan".
+
+    Retorna (códigos da esquerda, códigos da direita, número de chaves distintas, chaves normalizadas da esquerda).
+    """
+    left_codes, keys = _factorize_normalized(left)
+    key_index = pd.Index(keys)
+
+    right_codes = key_index.get_indexer(right)
+    missing = right_codes == -1
+    n_keys = len(keys)
+    if missing.any():
+        missing_codes, normalized = _factorize_normalized(right[missing])
+        found = key_index.get_indexer(normalized)
+        # Chaves só dos itens (sem nota no cabeçalho) recebem códigos novos, após os do cabeçalho
+        new = found == -1
+        found[new] = n_keys + np.arange(new.sum())
+        right_codes[missing] = found[missing_codes]
+        n_keys += int(new.sum())
+    left_keys = keys[left_codes]  # Referências às chaves distintas, sem cópias
+    return left_codes, right_codes, n_keys, left_keys
+
+
+def _take(series: pd.Series, indexer: np.ndarray, allow_fill: bool):
+    # -1 no indexador vira valor ausente, com a mesma promoção de tipo do merge (ex.: int -> float)
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    return pd.api.extensions.take(values, indexer, allow_fill=allow_fill)
+
+
+def join_on_key(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame, join_key: str,
+                suffixes=("_cab", "_item")) -> pd.DataFrame:
+    """
+    Junção à esquerda (cabeçalho -> itens) equivalente a
+    pd.merge(cabecalho_df, itens_df, on=join_key, how="left", suffixes=suffixes) com as chaves normalizadas
+    por str + strip: mesma ordem de linhas (cabeçalho na ordem original e, para cada nota, seus itens na ordem
+    original), mesmas colunas e tipos.
+
+    As chaves são fatoradas uma única vez (factorize_keys); os itens são agrupados por chave com um índice
+    (ordenação estável + contagem por chave) e cada coluna de saída é preenchida com um único `take`,
+    sem cópias intermediárias dos DataFrames.
+    """
+    left_codes, right_codes, n_keys, left_keys = factorize_keys(cabecalho_df[join_key], itens_df[join_key])
+
+    # Índice chave -> itens: posições dos itens ordenadas por chave (estável) e início/quantidade de cada chave
+    order = np.argsort(right_codes, kind="stable")
+    counts = np.bincount(right_codes, minlength=n_keys)
+    starts = np.cumsum(counts) - counts
+    del right_codes
+
+    matches = counts[left_codes]
+    repeats = np.maximum(matches, 1)  # Nota sem itens gera uma linha com as colunas de item ausentes
+    left_index = np.repeat(np.arange(len(cabecalho_df)), repeats)
+    # Posição de cada linha de saída em `order`: início do grupo da chave + deslocamento dentro do grupo
+    group_starts = np.cumsum(repeats) - repeats
+    positions = np.arange(len(left_index))
+    positions -= np.repeat(group_starts - starts[left_codes], repeats)
+    unmatched = bool((matches == 0).any())
+    if len(order):
+        right_index = order.take(positions, mode="clip")  # clip: notas sem itens são marcadas com -1 abaixo
+        if unmatched:
+            right_index[np.repeat(matches == 0, repeats)] = -1
+    else:
+        right_index = np.full(len(left_index), -1, dtype=np.intp)
+    del order, positions, group_starts
+
+    overlapping = (set(cabecalho_df.columns) & set(itens_df.columns)) - {join_key}
+    columns = {}
+    for col in cabecalho_df.columns:
+        name = f"{col}{suffixes[0]}" if col in overlapping else col
+        columns[name] = left_keys[left_index] if col == join_key else _take(cabecalho_df[col], left_index, False)
+    for col in itens_df.columns:
+        if col != join_key:
+            name = f"{col}{suffixes[1]}" if col in overlapping else col
+            columns[name] = _take(itens_df[col], right_index, unmatched)
+    return pd.DataFrame(columns, copy=False)
+
+
 def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> TransformResult:
     """
     Combina os DataFrames de cabeçalho e itens em um único DataFrame,
@@ -14,11 +125,14 @@ def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Transfor
     """
     logger.info("Iniciando combinação e transformação dos DataFrames.")
 
-    # Verifica se algum dos DataFrames de entrada está vazio
-    if cabecalho_df.empty or itens_df.empty:
-        msg = "Um ou ambos os DataFrames (cabeçalho/itens) estão vazios. Não é possível combinar."
+    # Sem cabeçalho não há notas para combinar
+    if cabecalho_df.empty:
+        msg = "O DataFrame de cabeçalho está vazio. Não é possível combinar."
         logger.warning(msg)
         return TransformResult(combined_df=pd.DataFrame(), status="error", message=msg)
+    # Sem itens (ex.: lote de XMLs de notas sem <det>) a junção à esquerda mantém as notas, com as colunas de item vazias
+    if itens_df.empty:
+        logger.warning("O DataFrame de itens está vazio: as notas serão gravadas sem itens.")
 
     def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         """Normaliza os nomes das colunas de um DataFrame para um formato SQL-friendly."""
@@ -33,9 +147,10 @@ def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Transfor
         logger.info(f"Colunas normalizadas. Original: {original_columns}, Nova: {df.columns.tolist()}")
         return df
 
-    # Normaliza as colunas de ambos os DataFrames
-    cabecalho_df = normalize_columns(cabecalho_df.copy())  # Usar .copy() para evitar SettingWithCopyWarning
-    itens_df = normalize_columns(itens_df.copy())
+    # Normaliza as colunas de ambos os DataFrames. Cópia rasa: os nomes das colunas e as colunas substituídas
+    # abaixo são do novo DataFrame, sem duplicar os dados nem alterar os DataFrames recebidos
+    cabecalho_df = normalize_columns(cabecalho_df.copy(deep=False))
+    itens_df = normalize_columns(itens_df.copy(deep=False))
 
     # Busca por chaves de junção potenciais em ordem de preferência
     possible_keys = ["chave_de_acesso", "chave", "numero_nf", "id_nota", "id"]
@@ -52,10 +167,6 @@ def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Transfor
         return TransformResult(combined_df=pd.DataFrame(), status="error", message=msg)
 
     try:
-        # Converter a chave de junção para string e remover espaços em branco para garantir a compatibilidade na junção
-        cabecalho_df[join_key] = cabecalho_df[join_key].astype(str).str.strip()
-        itens_df[join_key] = itens_df[join_key].astype(str).str.strip()
-
         # Normalização de colunas numéricas: converte para numérico e preenche NaNs com 0
         numeric_cols_cab = [col for col in ['valor_total', 'valor_total_da_nota', 'valor_total_nota'] if
                             col in cabecalho_df.columns]
@@ -69,10 +180,11 @@ def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Transfor
             itens_df[col] = pd.to_numeric(itens_df[col], errors='coerce').fillna(0)
             logger.debug(f"Coluna numérica item processada: {col}")
 
-        # Preencher NaNs em colunas de objeto (strings) com string vazia para evitar erros de tipo na junção ou no DB
-        for col in cabecalho_df.select_dtypes(include=['object']).columns:
+        # Preencher NaNs em colunas de objeto (strings) com string vazia para evitar erros de tipo na junção ou no DB.
+        # A chave de junção fica de fora: é normalizada na junção (chave ausente vira "nan", como no astype(str))
+        for col in cabecalho_df.select_dtypes(include=['object']).columns.drop(join_key, errors='ignore'):
             cabecalho_df[col] = cabecalho_df[col].fillna('')
-        for col in itens_df.select_dtypes(include=['object']).columns:
+        for col in itens_df.select_dtypes(include=['object']).columns.drop(join_key, errors='ignore'):
             itens_df[col] = itens_df[col].fillna('')
 
     except Exception as e:
@@ -81,10 +193,10 @@ def combine_data(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Transfor
         return TransformResult(combined_df=pd.DataFrame(), status="error", message=msg)
 
     try:
-        # Realiza a junção (merge) dos DataFrames usando a chave identificada
-        # how="left" garante que todas as notas do cabeçalho sejam mantidas
+        # Realiza a junção dos DataFrames usando a chave identificada (equivalente a pd.merge com how="left")
+        # A junção à esquerda garante que todas as notas do cabeçalho sejam mantidas
         # suffixes adiciona sufixos para colunas com nomes duplicados (e.g., id_cab, id_item)
-        combined_df = pd.merge(cabecalho_df, itens_df, on=join_key, how="left", suffixes=('_cab', '_item'))
+        combined_df = join_on_key(cabecalho_df, itens_df, join_key, suffixes=('_cab', '_item'))
 
         # Adiciona uma coluna 'processed_at' com a data e hora do processamento
         combined_df["processed_at"] = pd.Timestamp.now().isoformat()
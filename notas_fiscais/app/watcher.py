@@ -0,0 +1,253 @@
+# app/watcher.py
+import os
+import sqlite3
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from app.config import (INGEST_DONE_DIR, INGEST_FAILED_DIR, INGEST_STATE_PATH, INPUT_DIR, WATCH_POLL_INTERVAL,
+                        WATCH_WORKERS, XML_WORKERS, get_db_path)
+from app.logger import logger
+from app.run_etl import run_etl_pipeline
+
+# Serviço de ingestão contínua: varre INPUT_DIR, processa os ZIPs novos com run_etl_pipeline em um pool de
+# processos e move cada arquivo para _done/ ou _failed/. Layout de INPUT_DIR:
+#   INPUT_DIR/arquivo.zip            -> dataset padrão
+#   INPUT_DIR/<dataset>/arquivo.zip  -> dataset <dataset>
+# Arquivos ocultos (começando com ".") são ignorados: quem grava em INPUT_DIR pode escrever em ".nome.zip" e
+# renomear ao terminar. Sem rename, um arquivo é considerado completo quando tamanho e mtime não mudam entre
+# duas varreduras e ele é um ZIP válido (o diretório central fica no fim do arquivo).
+# Cada ZIP substitui os dados do seu dataset (como no upload), por isso arquivos de um mesmo dataset são
+# processados um de cada vez, do mais antigo para o mais novo; datasets diferentes rodam em paralelo.
+# Se um processo de ETL morre (ex.: falta de memória), o pool inteiro quebra e não dá para saber qual arquivo
+# causou a falha: os arquivos que estavam no pool voltam a ficar pendentes como suspeitos e são reprocessados
+# um de cada vez, sozinhos no pool. Só o arquivo que derruba o pool enquanto roda sozinho é marcado como falho.
+
+# Um arquivo parado há mais tempo que isso e que não é um ZIP válido é movido para _failed/
+INVALID_AFTER_SECONDS = 60
+
+IngestFile = namedtuple("IngestFile", ["name", "dataset", "size", "mtime_ns"])
+
+
+class IngestState:
+    """
+    Progresso durável da ingestão em SQLite: um registro por arquivo (caminho relativo a INPUT_DIR, tamanho e
+    mtime) com o status "processing", "done" ou "failed". Ao reiniciar, arquivos "done"/"failed" que ainda
+    estão em INPUT_DIR são apenas movidos, sem reprocessar; arquivos "processing" são processados de novo
+    (a carga é atômica e substitui o dataset, então repetir é seguro).
+    """
+
+    def __init__(self, path: Path = INGEST_STATE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_files ("
+            "name TEXT PRIMARY KEY, dataset TEXT, size INTEGER, mtime_ns INTEGER, "
+            "status TEXT, error TEXT, updated_at REAL)"
+        )
+        self.conn.commit()
+
+    def status(self, file: IngestFile):
+        """Retorna o status registrado para esta versão do arquivo (None se nunca vista)."""
+        row = self.conn.execute(
+            "SELECT status FROM ingest_files WHERE name = ? AND size = ? AND mtime_ns = ?",
+            (file.name, file.size, file.mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark(self, file: IngestFile, status: str, error: str = None) -> None:
+        self.conn.execute(
+            "INSERT INTO ingest_files (name, dataset, size, mtime_ns, status, error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET dataset = excluded.dataset, "
+            "size = excluded.size, mtime_ns = excluded.mtime_ns, status = excluded.status, "
+            "error = excluded.error, updated_at = excluded.updated_at",
+            (file.name, file.dataset, file.size, file.mtime_ns, status, error, time.time()),
+        )
+        self.conn.commit()  # Cada transição é gravada antes da ação seguinte (submeter ou mover o arquivo)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class IngestionWatcher:
+    """Varre INPUT_DIR periodicamente e processa os ZIPs completos em paralelo (ver comentário do módulo)."""
+
+    def __init__(self, workers: int = WATCH_WORKERS, poll_interval: float = WATCH_POLL_INTERVAL,
+                 state_path: Path = INGEST_STATE_PATH):
+        self.input_dir = INPUT_DIR  # run_etl_pipeline recebe nomes relativos a INPUT_DIR
+        self.workers = workers
+        # Processos de leitura de XMLs por carga: XML_WORKERS é dividido entre as cargas simultâneas, para que
+        # ZIPs de XMLs em paralelo não multipliquem processos e lotes em memória
+        self.xml_workers = max(1, XML_WORKERS // workers)
+        self.poll_interval = poll_interval
+        self.state = IngestState(state_path)
+        self.executor = None
+        self._last_seen = {}  # nome -> (tamanho, mtime) na varredura anterior
+        self._running = {}  # future -> (IngestFile, banco de destino, pool em que foi submetido)
+        self._suspects = set()  # Arquivos que estavam em um pool que quebrou (ver comentário do módulo)
+        self._isolated = None  # Suspeito rodando sozinho no pool
+        self._invalid_dirs = set()
+
+    def _scan(self):
+        """Lista os ZIPs visíveis de INPUT_DIR e das subpastas de dataset."""
+        for entry in sorted(self.input_dir.iterdir()):
+            if entry.name.startswith((".", "_")):
+                continue
+            if entry.is_dir():
+                try:
+                    get_db_path(entry.name)
+                except ValueError:
+                    if entry.name not in self._invalid_dirs:
+                        self._invalid_dirs.add(entry.name)
+                        logger.warning(f"Pasta ignorada em {self.input_dir}: '{entry.name}' não é um id de dataset válido.")
+                    continue
+                files = [(f, entry.name) for f in sorted(entry.iterdir())]
+            else:
+                files = [(entry, None)]
+            for path, dataset in files:
+                if path.name.startswith(".") or path.suffix.lower() != ".zip":
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # Removido ou renomeado durante a varredura
+                    continue
+                if path.is_file():
+                    yield IngestFile(name=path.relative_to(self.input_dir).as_posix(), dataset=dataset,
+                                     size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    def _readiness(self, file: IngestFile) -> str:
+        """Retorna "ready" (completo), "waiting" (ainda sendo gravado) ou "invalid" (parado e não é um ZIP válido)."""
+        previous = self._last_seen.get(file.name)
+        self._last_seen[file.name] = (file.size, file.mtime_ns)
+        if previous != (file.size, file.mtime_ns):
+            return "waiting"
+        if zipfile.is_zipfile(self.input_dir / file.name):
+            return "ready"
+        if time.time() - file.mtime_ns / 1e9 > INVALID_AFTER_SECONDS:
+            return "invalid"
+        return "waiting"
+
+    def _move(self, file: IngestFile, target_dir: Path) -> None:
+        """Move o arquivo para _done/ ou _failed/ (mesma subpasta de dataset), sem sobrescrever arquivos antigos."""
+        source = self.input_dir / file.name
+        if not source.exists():  # Removido por outra pessoa/processo durante o processamento
+            return
+        target = target_dir / file.name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            target = target.with_name(f"{target.stem}.{time.strftime('%Y%m%d%H%M%S')}{target.suffix}")
+        os.replace(source, target)
+        self._last_seen.pop(file.name, None)
+        logger.info(f"Arquivo {file.name} movido para {target.relative_to(self.input_dir)}.")
+
+    def _collect(self) -> None:
+        """Registra os arquivos cujo processamento terminou e os move para _done/ ou _failed/."""
+        for future in [f for f in self._running if f.done()]:
+            file, _, executor = self._running.pop(future)
+            isolated = self._isolated == file.name
+            if isolated:
+                self._isolated = None
+            try:
+                success, error = future.result(), None
+                if not success:
+                    error = "run_etl_pipeline falhou (detalhes no log)."
+            except BrokenProcessPool as e:
+                if executor is self.executor:  # Futures do pool antigo não derrubam o pool novo
+                    self._restart_executor()
+                if not isolated:
+                    # Pode ter sido outro arquivo do pool: volta a ficar pendente (status "processing")
+                    self._suspects.add(file.name)
+                    logger.warning(f"Pool de ETL quebrou durante {file.name}; o arquivo será reprocessado sozinho.")
+                    continue
+                success, error = False, f"Processo de ETL encerrado inesperadamente: {e}"
+            except CancelledError:
+                logger.warning(f"Processamento de {file.name} cancelado; o arquivo será submetido novamente.")
+                continue
+            except Exception as e:
+                success, error = False, str(e)
+
+            self._suspects.discard(file.name)
+            self.state.mark(file, "done" if success else "failed", error)
+            self._move(file, INGEST_DONE_DIR if success else INGEST_FAILED_DIR)
+            if success:
+                logger.info(f"Ingestão de {file.name} concluída.")
+            else:
+                logger.error(f"Ingestão de {file.name} falhou: {error}")
+
+    def _restart_executor(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def poll(self) -> int:
+        """Executa uma varredura: coleta resultados e submete os arquivos prontos. Retorna quantos estão pendentes."""
+        self._collect()
+
+        running_names = {file.name for file, _, _ in self._running.values()}
+        busy = {db_path for _, db_path, _ in self._running.values()}
+        files = sorted(self._scan(), key=lambda f: f.mtime_ns)
+        self._suspects &= {file.name for file in files}  # Suspeitos removidos de INPUT_DIR
+        pending = 0
+        for file in files:
+            if file.name in running_names:
+                continue
+            status = self.state.status(file)
+            if status in ("done", "failed"):
+                # Já processado antes de uma interrupção, mas ainda não movido
+                self._move(file, INGEST_DONE_DIR if status == "done" else INGEST_FAILED_DIR)
+                continue
+            readiness = self._readiness(file)
+            if readiness == "invalid":
+                self.state.mark(file, "failed", "Arquivo ZIP inválido ou incompleto.")
+                self._move(file, INGEST_FAILED_DIR)
+                logger.error(f"Ingestão de {file.name} falhou: arquivo ZIP inválido ou incompleto.")
+                continue
+            pending += 1
+            if readiness == "waiting":
+                continue
+            db_path = get_db_path(file.dataset)
+            if db_path in busy:
+                continue  # Espera a carga anterior do mesmo dataset terminar
+            if self._isolated is not None or (self._suspects and (file.name not in self._suspects or self._running)):
+                continue  # Suspeitos rodam um de cada vez, sozinhos no pool, antes dos demais arquivos
+
+            if status == "processing":
+                logger.info(f"Retomando processamento interrompido de {file.name}.")
+            self.state.mark(file, "processing")
+            try:
+                future = self.executor.submit(run_etl_pipeline, file.name, file.dataset, self.xml_workers)
+            except BrokenProcessPool:  # O pool quebrou depois da coleta acima
+                self._restart_executor()
+                future = self.executor.submit(run_etl_pipeline, file.name, file.dataset, self.xml_workers)
+            self._running[future] = (file, db_path, self.executor)
+            busy.add(db_path)
+            if file.name in self._suspects:
+                self._isolated = file.name
+                logger.info(f"Reprocessando {file.name} sozinho no pool para isolar a falha anterior.")
+            logger.info(f"Arquivo {file.name} enviado para processamento (dataset: {file.dataset or 'padrão'}).")
+        return pending
+
+    def run(self, until_idle: bool = False) -> None:
+        """
+        Executa o serviço até ser interrompido (Ctrl+C). Com until_idle=True, para quando não houver
+        arquivos pendentes nem em processamento (útil em agendamentos como cron).
+        """
+        INGEST_DONE_DIR.mkdir(parents=True, exist_ok=True)
+        INGEST_FAILED_DIR.mkdir(parents=True, exist_ok=True)
+        self._restart_executor()
+        logger.info(f"Monitorando {self.input_dir} a cada {self.poll_interval}s com {self.workers} processo(s) de ETL "
+                    f"({self.xml_workers} processo(s) de leitura de XMLs por carga).")
+        try:
+            while True:
+                pending = self.poll()
+                if until_idle and not pending and not self._running:
+                    break
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            # Arquivos em processamento continuam como "processing" e são retomados no próximo início
+            logger.info("Serviço de ingestão interrompido.")
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.state.close()
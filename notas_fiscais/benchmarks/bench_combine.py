@@ -0,0 +1,93 @@
+# benchmarks/bench_combine.py
+"""
+Benchmark da junção cabeçalho -> itens de combine_data.
+
+Compara, sobre os mesmos DataFrames sintéticos (colunas já normalizadas):
+  - pd.merge:    caminho anterior (astype(str).str.strip() nas duas chaves + pd.merge how="left")
+  - join_on_key: fatoração compartilhada das chaves + índice chave -> itens + take por coluna
+Mede tempo (mediana) e pico de memória alocada durante a junção (tracemalloc), e confere que os
+dois resultados são idênticos. Algumas chaves são trocadas por valores ausentes (None, NaN) e pelo texto
+"nan", para que a conferência cubra também as chaves ausentes.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_combine --sizes 100000,1000000 --repeat 3
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from benchmarks.common import make_synthetic_data, print_table
+from app.transform import join_on_key
+
+JOIN_KEY = "chave_de_acesso"
+
+
+def merge_join(cabecalho: pd.DataFrame, itens: pd.DataFrame) -> pd.DataFrame:
+    """Junção como era feita antes em combine_data."""
+    cabecalho = cabecalho.copy(deep=False)
+    itens = itens.copy(deep=False)
+    cabecalho[JOIN_KEY] = cabecalho[JOIN_KEY].astype(str).str.strip()
+    itens[JOIN_KEY] = itens[JOIN_KEY].astype(str).str.strip()
+    return pd.merge(cabecalho, itens, on=JOIN_KEY, how="left", suffixes=("_cab", "_item"))
+
+
+def indexed_join(cabecalho: pd.DataFrame, itens: pd.DataFrame) -> pd.DataFrame:
+    return join_on_key(cabecalho, itens, JOIN_KEY, suffixes=("_cab", "_item"))
+
+
+METHODS = {"pd.merge": merge_join, "join_on_key": indexed_join}
+
+
+def with_missing_keys(cabecalho: pd.DataFrame, itens: pd.DataFrame):
+    """Troca as chaves das primeiras notas/itens por None, NaN e "nan" (astype(str) os mantém distintos)."""
+    cabecalho[JOIN_KEY] = cabecalho[JOIN_KEY].astype(object)
+    itens[JOIN_KEY] = itens[JOIN_KEY].astype(object)
+    cabecalho.loc[:1, JOIN_KEY] = [None, np.nan]
+    itens.loc[:2, JOIN_KEY] = [None, "nan", np.nan]
+    return cabecalho, itens
+
+
+def measure(func, cabecalho, itens, repeat: int):
+    """Retorna (mediana em segundos, pico de memória em MB, resultado da última execução)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(cabecalho, itens)
+        times.append(time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = func(cabecalho, itens)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak / 2 ** 20, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da junção de combine_data.")
+    parser.add_argument("--sizes", default="100000,1000000", help="Números de notas, separados por vírgula.")
+    parser.add_argument("--items-per-note", type=int, default=4, help="Itens por nota.")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por método (tempo = mediana).")
+    args = parser.parse_args()
+
+    rows = []
+    for n_notas in [int(s) for s in args.sizes.split(",")]:
+        cabecalho, itens = make_synthetic_data(n_notas, itens_por_nota=args.items_per_note)
+        cabecalho.columns = [c.lower().replace(" ", "_") for c in cabecalho.columns]
+        itens.columns = [c.lower().replace(" ", "_") for c in itens.columns]
+        cabecalho, itens = with_missing_keys(cabecalho, itens)
+
+        results = {}
+        for name, func in METHODS.items():
+            seconds, peak_mb, results[name] = measure(func, cabecalho, itens, args.repeat)
+            rows.append([f"{n_notas}", f"{len(itens)}", name, f"{seconds * 1000:.0f}", f"{peak_mb:.0f}"])
+        pd.testing.assert_frame_equal(results["pd.merge"], results["join_on_key"])
+
+    print("\nJunção cabeçalho -> itens (resultados idênticos):")
+    print_table(["notas", "itens", "metodo", "tempo (ms)", "pico mem (MB)"], rows)
+
+
+if __name__ == "__main__":
+    main()
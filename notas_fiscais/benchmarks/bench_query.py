@@ -0,0 +1,175 @@
+# benchmarks/bench_query.py
+"""
+Benchmark do caminho de consulta (query_data) com um LLM falso (StubChatModel).
+
+Mede apenas o overhead do framework em torno do modelo, por fase:
+  - reflexao:   criação do SQLDatabase e leitura do esquema (get_table_info), a frio
+  - construcao: montagem do prompt e do executor do agente, a frio
+  - cache:      obtenção do agente em cache (get_agent), por pergunta
+  - agente:     laço do agente sem o tempo do LLM e sem o tempo do SQL
+  - sql:        execução das queries no SQLite (ferramenta sql_db_query)
+  - formatacao: classificação e empacotamento da resposta
+O tempo gasto dentro do LLM é medido à parte e excluído do total.
+Também reporta iterações do agente e tokens (estimados) por pergunta.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_query --sizes 1000,10000,100000 --repeat 5
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from langchain_core.callbacks import BaseCallbackHandler
+from benchmarks.common import PhaseTimer, make_synthetic_data, print_table
+from app.database import get_fts_columns, save_to_database
+from app.llm_stub import StubChatModel
+from app.query_tools import AgentStatsHandler
+from app.query import build_agent, build_database, build_prompt, format_answer, get_agent, set_llm
+from app.transform import combine_data
+
+# Conjunto fixo de perguntas com as chamadas de ferramenta que o LLM falso reproduz
+QUESTIONS = {
+    "Qual fornecedor recebeu o maior montante total?": {
+        "sql": ["SELECT razao_social_emitente, SUM(valor_total) AS total FROM notas_fiscais "
+                "GROUP BY razao_social_emitente ORDER BY total DESC LIMIT 1"],
+        "answer": "O fornecedor com maior montante foi: {observation}",
+    },
+    "Qual item teve maior quantidade entregue?": {
+        "sql": ["SELECT descricao_do_produto_servico, SUM(quantidade) AS qtd FROM notas_fiscais "
+                "GROUP BY descricao_do_produto_servico ORDER BY qtd DESC LIMIT 1"],
+        "answer": "O item com maior quantidade foi: {observation}",
+    },
+    "Quantas notas foram emitidas?": {
+        "sql": ["SELECT COUNT(DISTINCT chave_de_acesso) FROM notas_fiscais"],
+        "answer": "Foram emitidas {observation} notas.",
+    },
+    "Qual o valor médio das notas?": {
+        "sql": ["SELECT AVG(valor_nota_fiscal) FROM "
+                "(SELECT DISTINCT chave_de_acesso, valor_nota_fiscal FROM notas_fiscais)"],
+        "answer": "O valor médio das notas é R$ {observation}.",
+    },
+    "Quanto compramos de papel A4?": {
+        "sql": ["SELECT SUM(quantidade), SUM(valor_total) FROM notas_fiscais WHERE rowid IN "
+                "(SELECT rowid FROM notas_fiscais_fts WHERE notas_fiscais_fts MATCH "
+                "'descricao_do_produto_servico : (papel a4)')"],
+        "answer": "Quantidade e valor comprados de papel A4: {observation}",
+    },
+    "Qual UF de destino concentra mais notas e quanto ela gastou?": {
+        "sql": ["SELECT uf_destinatario, COUNT(DISTINCT chave_de_acesso) AS n FROM notas_fiscais "
+                "GROUP BY uf_destinatario ORDER BY n DESC LIMIT 1",
+                "SELECT uf_destinatario, SUM(valor_total) FROM notas_fiscais "
+                "GROUP BY uf_destinatario ORDER BY 2 DESC LIMIT 1"],
+        "answer": "UF com mais notas e seu gasto: {observation}",
+    },
+}
+
+
+PHASES = ["reflexao", "construcao", "cache", "agente", "sql", "formatacao"]
+PER_QUESTION_PHASES = ["cache", "agente", "sql", "formatacao"]
+
+# LLM falso compartilhado por todas as perguntas (não guarda estado entre chamadas)
+llm = StubChatModel(script=QUESTIONS)
+
+
+class AgentTimingHandler(BaseCallbackHandler):
+    """Callback que mede o tempo gasto dentro do LLM e dentro das ferramentas (SQL)."""
+
+    def __init__(self):
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.llm_seconds += time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.tool_seconds += time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+
+
+def build_db(db_path: Path, n_notas: int) -> int:
+    """Gera dados sintéticos, passa pelo transform/load reais e retorna o número de linhas gravadas."""
+    cabecalho, itens = make_synthetic_data(n_notas)
+    transform_result = combine_data(cabecalho, itens)
+    database_result = save_to_database(transform_result.combined_df, db_path)
+    if not database_result.status.startswith("success"):
+        raise RuntimeError(database_result.message)
+    return len(transform_result.combined_df)
+
+
+def measure_cold_build(db_path: Path, timer: PhaseTimer):
+    """Mede a construção a frio do agente (o que get_agent faz quando os dados mudam)."""
+    with timer.phase("reflexao"):
+        db = build_database(db_path)
+        table_info = db.get_table_info()
+
+    with timer.phase("construcao"):
+        fts_columns = get_fts_columns(db_path)
+        build_agent(llm, db, build_prompt(table_info, fts_columns), fts_columns)
+    db._engine.dispose()
+
+
+def run_question(question: str, db_path: Path, timer: PhaseTimer):
+    """Executa uma pergunta pelo mesmo caminho de query_data, medindo cada fase. Retorna o QueryResult."""
+    with timer.phase("cache"):
+        bundle = get_agent(db_path)
+
+    handler, stats_handler = AgentTimingHandler(), AgentStatsHandler()
+    start = time.perf_counter()
+    agent_response = bundle.executor.invoke({"input": question}, config={"callbacks": [handler, stats_handler]})
+    total = time.perf_counter() - start
+    timer.add("llm (excluido)", handler.llm_seconds)
+    timer.add("sql", handler.tool_seconds)
+    timer.add("agente", total - handler.llm_seconds - handler.tool_seconds)
+
+    with timer.phase("formatacao"):
+        result = format_answer(agent_response.get("output", str(agent_response)), stats_handler.as_dict())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do caminho de consulta com LLM falso.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Quantidades de notas fiscais por banco (4 itens por nota), separadas por vírgula.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições de cada pergunta por tamanho de banco.")
+    args = parser.parse_args()
+
+    set_llm(llm)
+    rows, stats_rows = [], []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_notas in [int(s) for s in args.sizes.split(",")]:
+            db_path = Path(tmp_dir) / f"bench_{n_notas}.db"
+            n_rows = build_db(db_path, n_notas)
+            timer = PhaseTimer()
+            for _ in range(args.repeat):
+                measure_cold_build(db_path, timer)
+            get_agent(db_path)  # Aquece o cache; as perguntas medem apenas o caminho com cache
+            for _ in range(args.repeat):
+                for question in QUESTIONS:
+                    result = run_question(question, db_path, timer)
+                    if result.status != "success":
+                        raise RuntimeError(f"Pergunta '{question}' retornou status '{result.status}'.")
+            stats_rows += [[n_rows, question[:45]] + list(result.stats.values()) for question, result in
+                           ((q, run_question(q, db_path, PhaseTimer())) for q in QUESTIONS)]
+            overhead = sum(timer.median_ms(p) for p in PER_QUESTION_PHASES)
+            rows.append([n_rows] + [f"{timer.median_ms(p):.2f}" for p in PHASES]
+                        + [f"{overhead:.2f}", f"{timer.median_ms('llm (excluido)'):.2f}"])
+
+    print("\nLatência mediana (ms). reflexao/construcao: construção a frio do agente, paga só quando os dados mudam.")
+    print("total: overhead por pergunta com o agente em cache, LLM excluído.")
+    print_table(["linhas"] + PHASES + ["total", "llm (excluido)"], rows)
+
+    print("\nIterações e tokens (estimados) por pergunta:")
+    print_table(["linhas", "pergunta", "iteracoes", "chamadas llm", "tokens prompt", "tokens resposta"], stats_rows)
+
+
+if __name__ == "__main__":
+    main()
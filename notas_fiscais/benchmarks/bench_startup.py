@@ -0,0 +1,92 @@
+# benchmarks/bench_startup.py
+"""
+Benchmark de inicialização a frio e custo de importação dos pontos de entrada.
+
+Cada cenário roda em um processo Python novo e mede tempo de parede, memória máxima (RSS)
+e quais dependências pesadas foram carregadas. Para o cenário da CLI de ETL, mostra também
+os módulos com maior custo cumulativo de importação (-X importtime).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_startup --repeat 5 --target-ms 1000
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.common import PROJECT_ROOT, print_table
+
+HEAVY_MODULES = ["transformers", "torch", "langchain", "langchain_community", "langchain_core",
+                 "huggingface_hub", "streamlit", "llama_cpp"]
+
+SCENARIOS = {
+    "cli etl": "import run; from app.run_etl import run_etl_pipeline",
+    "boot api": "import run; from app.api import app",
+    "cli query (sem LLM)": "import run; from app.query import query_data",
+}
+
+REPORT = (
+    "import json, resource, sys; "
+    "print(json.dumps({'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "
+    "'heavy': sorted(m for m in %r if m in sys.modules)}))"
+)
+
+
+def run_scenario(code: str) -> dict:
+    """Executa o código em um interpretador novo e retorna tempo de parede, RSS e módulos pesados carregados."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", f"{code}; {REPORT % (HEAVY_MODULES,)}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["wall_ms"] = wall * 1000
+    return report
+
+
+def top_imports(code: str, n: int = 10):
+    """Retorna os n módulos com maior tempo cumulativo de importação (inclui os importados por outros)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((int(cumulative) / 1000, name.strip()))
+    return sorted(entries, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização da CLI e da API.")
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por cenário.")
+    parser.add_argument("--target-ms", type=float, default=1000.0,
+                        help="Meta de inicialização a frio da CLI de ETL, em milissegundos.")
+    args = parser.parse_args()
+
+    rows, etl_wall = [], None
+    for name, code in SCENARIOS.items():
+        reports = [run_scenario(code) for _ in range(args.repeat)]
+        wall = statistics.median(r["wall_ms"] for r in reports)
+        if name == "cli etl":
+            etl_wall = wall
+        rows.append([name, f"{wall:.0f}", f"{max(r['rss_mb'] for r in reports):.0f}",
+                     ", ".join(reports[-1]["heavy"]) or "-"])
+
+    print("\nInicialização a frio (mediana):")
+    print_table(["cenario", "tempo (ms)", "rss (MB)", "dependencias pesadas"], rows)
+
+    print("\nMaiores custos de importação da CLI de ETL (cumulativo):")
+    print_table(["ms", "modulo"], [[f"{ms:.1f}", name] for ms, name in top_imports(SCENARIOS["cli etl"])])
+
+    status = "OK" if etl_wall <= args.target_ms else "ACIMA DA META"
+    print(f"\nCLI de ETL: {etl_wall:.0f} ms (meta: {args.target_ms:.0f} ms) -> {status}")
+    sys.exit(0 if etl_wall <= args.target_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
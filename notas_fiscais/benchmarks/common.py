@@ -0,0 +1,83 @@
+# benchmarks/common.py
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório raiz do projeto ao sys.path para que 'app' seja importável
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+FORNECEDORES = [
+    "PAPELARIA CENTRAL LTDA", "DISTRIBUIDORA SÃO JOÃO S.A.", "INFORMÁTICA BRASIL ME",
+    "LIMPEZA TOTAL EIRELI", "MÓVEIS ESCRITÓRIO LTDA", "COMERCIAL AÇAÍ LTDA",
+]
+PRODUTOS = [
+    "PAPEL A4 SULFITE 75G", "CANETA ESFEROGRÁFICA AZUL", "TONER IMPRESSORA LASER",
+    "DETERGENTE NEUTRO 5L", "CADEIRA GIRATÓRIA", "CAFÉ TORRADO 500G", "PAPEL HIGIÊNICO FOLHA DUPLA",
+]
+UFS = ["DF", "SP", "RJ", "MG", "GO", "BA"]
+
+
+def make_synthetic_data(n_notas: int, itens_por_nota: int = 4, seed: int = 42):
+    """
+    Gera DataFrames de cabeçalho e itens no formato dos CSVs de notas fiscais (nomes de colunas originais).
+    """
+    rng = np.random.default_rng(seed)
+    chaves = np.array([f"{i:044d}" for i in range(n_notas)], dtype=object)
+    cabecalho = pd.DataFrame({
+        "CHAVE DE ACESSO": chaves,
+        "NÚMERO": np.arange(1, n_notas + 1),
+        "DATA EMISSÃO": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n_notas), unit="D"),
+        "RAZÃO SOCIAL EMITENTE": rng.choice(FORNECEDORES, n_notas),
+        "UF EMITENTE": rng.choice(UFS, n_notas),
+        "NOME DESTINATÁRIO": rng.choice(["MINISTÉRIO DA ECONOMIA", "TRIBUNAL DE CONTAS DA UNIÃO"], n_notas),
+        "UF DESTINATÁRIO": rng.choice(UFS, n_notas),
+        "VALOR NOTA FISCAL": rng.uniform(50, 50000, n_notas).round(2),
+    })
+    n_itens = n_notas * itens_por_nota
+    quantidade = rng.integers(1, 100, n_itens)
+    valor_unitario = rng.uniform(1, 500, n_itens).round(2)
+    itens = pd.DataFrame({
+        "CHAVE DE ACESSO": np.repeat(chaves, itens_por_nota),
+        "NÚMERO PRODUTO": np.tile(np.arange(1, itens_por_nota + 1), n_notas),
+        "DESCRIÇÃO DO PRODUTO/SERVIÇO": rng.choice(PRODUTOS, n_itens),
+        "QUANTIDADE": quantidade,
+        "VALOR UNITÁRIO": valor_unitario,
+        "VALOR TOTAL": (quantidade * valor_unitario).round(2),
+    })
+    return cabecalho, itens
+
+
+class PhaseTimer:
+    """Acumula amostras de tempo (em segundos) por fase."""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def median_ms(self, name: str) -> float:
+        values = self.samples.get(name)
+        return statistics.median(values) * 1000 if values else 0.0
+
+
+def print_table(headers, rows):
+    """Imprime uma tabela alinhada por coluna no stdout."""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
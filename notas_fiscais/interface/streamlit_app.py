@@ -33,6 +33,14 @@ Bem-vindo ao Agente IA de Notas Fiscais!
 2.  **Envie suas perguntas** em linguagem natural sobre os dados carregados.
 """)
 
+# --- Dataset / empresa ---
+# Cada dataset tem seu próprio banco na API; vazio usa o banco padrão
+dataset = st.sidebar.text_input(
+    "Dataset / empresa",
+    help="Identificador do cliente (letras, números, '_' ou '-'). Uploads e perguntas ficam restritos a ele.",
+).strip()
+dataset_params = {"dataset": dataset} if dataset else {}
+
 # --- Seção de Upload de Arquivos ---
 st.subheader("📎 Upload do Arquivo ZIP das Notas Fiscais")
 uploaded_file = st.file_uploader(
@@ -67,6 +75,7 @@ if uploaded_file:
                         response = requests.post(
                             f"{API_BASE_URL}/upload/",
                             files=files,
+                            params=dataset_params,
                             timeout=600  # Aumenta o timeout para 10 minutos para processamentos longos
                         )
 
@@ -111,7 +120,7 @@ if st.button("Perguntar ao Agente"):
                 # Faz a requisição GET para o endpoint de consulta da API
                 response = requests.get(
                     f"{API_BASE_URL}/query/",
-                    params={"question": question},
+                    params={"question": question, **dataset_params},
                     timeout=300  # Aumenta o timeout para 5 minutos
                 )
 
@@ -7,51 +7,100 @@ import os
 # Este script está na raiz, então 'app' é acessível.
 sys.path.append(str(Path(__file__).parent))
 
-from app.run_etl import run_etl_pipeline
-from app.query import query_data
+# Apenas módulos leves no topo: pipeline ETL, agente de IA e servidores são importados
+# dentro do comando que os usa, para acelerar a inicialização da CLI.
 from app.config import INPUT_DIR, API_BASE_URL  # Importar API_BASE_URL para mensagens úteis
 from app.logger import logger
 
 
+def _pop_option(args: list, name: str):
+    """Remove `name <valor>` da lista de argumentos e retorna o valor (ou None se a opção não foi passada)."""
+    if name not in args:
+        return None
+    index = args.index(name)
+    if index + 1 >= len(args):
+        raise ValueError(f"A opção {name} exige um valor.")
+    value = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+def _pop_flag(args: list, name: str) -> bool:
+    """Remove a opção booleana `name` da lista de argumentos e indica se ela foi passada."""
+    if name not in args:
+        return False
+    args.remove(name)
+    return True
+
+
 def main_cli():
     logger.info("Iniciando Agente de IA via CLI.")
 
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    try:
+        dataset = _pop_option(args, "--dataset")  # Dataset/cliente de destino (opcional)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+    profile = _pop_flag(args, "--profile")  # Grava perfil de CPU e memória da execução (opcional)
+
+    if len(args) < 1:
         logger.info("Uso: python run.py <comando> [argumentos]")
         logger.info("Comandos disponíveis:")
         logger.info("  etl <arquivo.zip>       - Processa um arquivo ZIP via pipeline ETL.")
         logger.info("  query \"<pergunta>\"    - Faz uma pergunta em linguagem natural ao agente de IA.")
+        logger.info("  watch [--until-idle]    - Serviço de ingestão: processa os ZIPs que chegarem em INPUT_DIR "
+                    "(subpastas = datasets).")
         logger.info("  start_api               - Inicia a API FastAPI (http://0.0.0.0:8000).")
         logger.info("  start_streamlit         - Inicia a interface Streamlit (http://0.0.0.0:8501).")
+        logger.info("  bench_llm \"<configs>\"   - Mede tokens/s de configurações de inferência (ex: "
+                    "\"llamacpp:n_threads=4;llamacpp:n_threads=8,n_batch=256\").")
+        logger.info("Opções de etl e query:")
+        logger.info("  --dataset <id>          - Usa o banco do dataset/cliente informado em vez do banco padrão.")
+        logger.info("  --profile               - Grava perfil de CPU (cProfile) e memória por etapa em data/profiles/.")
         return
 
-    command = sys.argv[1].lower()
+    command = args[0].lower()
 
     if command == "etl":
-        if len(sys.argv) < 3:
-            logger.error("Uso: python run.py etl <nome_do_arquivo.zip>")
+        if len(args) < 2:
+            logger.error("Uso: python run.py etl <nome_do_arquivo.zip> [--dataset <id>] [--profile]")
             return
-        file_name = sys.argv[2]
+        file_name = args[1]
         zip_file_path = INPUT_DIR / file_name
 
         if not zip_file_path.exists():
             logger.error(f"Arquivo não encontrado: {zip_file_path}. Coloque o ZIP em '{INPUT_DIR}'.")
             return
 
+        from app.run_etl import run_etl_pipeline
+
         logger.info(f"Executando ETL para: {file_name}")
-        success = run_etl_pipeline(file_name)
+        if profile:
+            from app.profiling import run_profiled
+            success, profile_id = run_profiled("etl", file_name, run_etl_pipeline, file_name, dataset)
+            logger.info(f"Perfil da execução: data/profiles/{profile_id}/")
+        else:
+            success = run_etl_pipeline(file_name, dataset)
         if success:
             logger.info(f"ETL para {file_name} concluído.")
         else:
             logger.error(f"ETL para {file_name} falhou. Verifique os logs para mais detalhes.")
 
     elif command == "query":
-        if len(sys.argv) < 3:
-            logger.error("Uso: python run.py query \"Sua pergunta aqui\"")
+        if len(args) < 2:
+            logger.error("Uso: python run.py query \"Sua pergunta aqui\" [--dataset <id>] [--profile]")
             return
-        question = " ".join(sys.argv[2:])
+        question = " ".join(args[1:])
+        from app.query import query_data
+
         logger.info(f"Executando consulta: \"{question}\"")
-        result = query_data(question)
+        if profile:
+            from app.profiling import run_profiled
+            result, profile_id = run_profiled("query", question, query_data, question, dataset)
+            logger.info(f"Perfil da consulta: data/profiles/{profile_id}/")
+        else:
+            result = query_data(question, dataset)
         if result.status.startswith("success") or result.status == "warning":
             logger.info("Consulta executada.")
             logger.info(f"Mensagem: {result.message}")
@@ -62,6 +111,19 @@ def main_cli():
         else:
             logger.error(f"Erro na consulta: {result.message}")
 
+    elif command == "bench_llm":
+        from app.config import LLM_BACKEND, LLM_SELF_BENCHMARK
+        from app.llm_backends import run_self_benchmark
+
+        # Sem argumentos, usa LLM_SELF_BENCHMARK ou apenas a configuração atual
+        run_self_benchmark(" ".join(args[1:]) or LLM_SELF_BENCHMARK or LLM_BACKEND)
+
+    elif command == "watch":
+        from app.watcher import IngestionWatcher
+
+        # Com --until-idle, encerra quando não houver mais arquivos pendentes (ex.: execução agendada)
+        IngestionWatcher().run(until_idle="--until-idle" in args[1:])
+
     elif command == "start_api":
         logger.info("Iniciando API FastAPI em http://0.0.0.0:8000...")
         import uvicorn
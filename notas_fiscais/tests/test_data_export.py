@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import pytest
+from app.data_export import iter_export, prepare_export
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "notas.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE notas_fiscais (a TEXT, b TEXT, v REAL)")
+        conn.executemany(
+            "INSERT INTO notas_fiscais VALUES (?, ?, ?)",
+            [(None, "x", 1.0), (None, None, 2.0), ("A", None, 3.0), ("A", "y", 4.0), ("B", "z", 5.0),
+             ("B", "z", 6.0)],
+        )
+    return path
+
+
+def _rows(db_path, **kwargs) -> list:
+    export = prepare_export(db_path, format="ndjson", **kwargs)
+    body = b"".join(iter_export(export)).decode("utf-8")
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def _paginate(db_path, group_by, limit=1) -> list:
+    """Percorre todas as páginas seguindo o `after` da última linha de cada página."""
+    pages, after = [], None
+    while True:
+        rows = _rows(db_path, group_by=group_by, aggregates=["sum:v"], after=after, limit=limit)
+        if not rows:
+            return pages
+        pages.extend(rows)
+        after = json.dumps([rows[-1][c] for c in group_by])
+
+
+def test_grouped_pages_cover_groups_with_null_in_one_column(db_path):
+    rows = _paginate(db_path, ["a"])
+    assert [(r["a"], r["sum_v"]) for r in rows] == [(None, 3.0), ("A", 7.0), ("B", 11.0)]
+
+
+def test_grouped_pages_cover_groups_with_null_in_two_columns(db_path):
+    rows = _paginate(db_path, ["a", "b"])
+    assert [(r["a"], r["b"]) for r in rows] == [(None, None), (None, "x"), ("A", None), ("A", "y"), ("B", "z")]
+    assert rows == _rows(db_path, group_by=["a", "b"], aggregates=["sum:v"])  # Igual ao resultado sem paginar
+
+
+@pytest.mark.parametrize("after, expected", [
+    ('[null, "x"]', [("A", None), ("A", "y"), ("B", "z")]),
+    ('["A", null]', [("A", "y"), ("B", "z")]),
+    ('[null, null]', [(None, "x"), ("A", None), ("A", "y"), ("B", "z")]),
+])
+def test_grouped_after_with_null_values(db_path, after, expected):
+    rows = _rows(db_path, group_by=["a", "b"], aggregates=["sum:v"], after=after)
+    assert [(r["a"], r["b"]) for r in rows] == expected
+
+
+def test_rowid_pages_cover_all_rows(db_path):
+    first = _rows(db_path, columns=["a"], limit=4)
+    rest = _rows(db_path, columns=["a"], after=str(first[-1]["_rowid"]))
+    assert [r["_rowid"] for r in first + rest] == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize("after", ['["A"]', '"A"', "5"])
+def test_after_on_aggregate_without_group_by_is_rejected(db_path, after):
+    with pytest.raises(ValueError):
+        prepare_export(db_path, aggregates=["sum:v"], after=after)
+
+
+@pytest.mark.parametrize("after", ['"A"', '["A", "x"]', "não é json"])
+def test_invalid_grouped_after_is_rejected(db_path, after):
+    with pytest.raises(ValueError):
+        prepare_export(db_path, group_by=["a"], aggregates=["sum:v"], after=after)
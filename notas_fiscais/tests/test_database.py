@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import time
+import pandas as pd
+import pytest
+from app.database import STALE_SHADOW_SECONDS, ShadowLoad, reader_uri
+
+
+def _frame(n_rows: int, start: int = 0) -> pd.DataFrame:
+    return pd.DataFrame({
+        "chave_de_acesso": [f"{i:044d}" for i in range(start, start + n_rows)],
+        "razao_social_emitente": [f"Fornecedor {i}" for i in range(start, start + n_rows)],
+        "valor_total": [float(i) for i in range(start, start + n_rows)],
+    })
+
+
+def _count(db_path) -> int:
+    with sqlite3.connect(reader_uri(db_path), uri=True) as conn:
+        return conn.execute("SELECT COUNT(*) FROM notas_fiscais").fetchone()[0]
+
+
+def _shadows(db_path) -> list:
+    return list(db_path.parent.glob(f".{db_path.name}.*.loading"))
+
+
+def test_publish_replaces_database_with_all_batches(tmp_path):
+    db_path = tmp_path / "notas.db"
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(3))
+        load.append(_frame(2, start=3))
+        assert not db_path.exists()  # Nada é visível antes da publicação
+        load.publish()
+
+    assert load.rows == 5
+    assert _count(db_path) == 5
+    assert _shadows(db_path) == []
+
+
+def test_open_reader_keeps_previous_snapshot(tmp_path):
+    db_path = tmp_path / "notas.db"
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(3))
+        load.publish()
+
+    reader = sqlite3.connect(reader_uri(db_path), uri=True)
+    try:
+        with ShadowLoad(db_path) as load:
+            load.append(_frame(7))
+            load.publish()
+        assert reader.execute("SELECT COUNT(*) FROM notas_fiscais").fetchone()[0] == 3
+    finally:
+        reader.close()
+    assert _count(db_path) == 7
+
+
+def test_failed_load_discards_shadow_and_keeps_published_database(tmp_path):
+    db_path = tmp_path / "notas.db"
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(3))
+        load.publish()
+
+    with pytest.raises(RuntimeError):
+        with ShadowLoad(db_path) as load:
+            load.append(_frame(10))
+            raise RuntimeError("falha no meio da carga")
+
+    assert _count(db_path) == 3
+    assert _shadows(db_path) == []
+
+
+def test_load_without_publish_leaves_no_database(tmp_path):
+    db_path = tmp_path / "notas.db"
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(3))
+
+    assert not db_path.exists()
+    assert _shadows(db_path) == []
+
+
+def test_stale_shadows_are_removed_and_recent_ones_kept(tmp_path):
+    db_path = tmp_path / "notas.db"
+    stale = tmp_path / f".{db_path.name}.abandonado.loading"
+    recent = tmp_path / f".{db_path.name}.em_andamento.loading"
+    stale.write_bytes(b"")
+    recent.write_bytes(b"")
+    old = time.time() - STALE_SHADOW_SECONDS - 60
+    os.utime(stale, (old, old))
+
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(1))
+        load.publish()
+
+    assert not stale.exists()
+    assert recent.exists()
+
+
+@pytest.mark.parametrize("folder", ["dados #1", "dados ?x=1", "dados %20 100%"])
+def test_reader_uri_opens_database_in_folder_with_uri_characters(tmp_path, folder):
+    db_path = tmp_path / folder / "notas.db"
+    db_path.parent.mkdir()
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(4))
+        load.publish()
+
+    assert _count(db_path) == 4
+    with sqlite3.connect(reader_uri(db_path), uri=True) as conn:
+        with pytest.raises(sqlite3.OperationalError):  # Somente leitura
+            conn.execute("DELETE FROM notas_fiscais")
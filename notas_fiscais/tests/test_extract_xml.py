@@ -0,0 +1,138 @@
+import io
+import sqlite3
+import zipfile
+import pytest
+from app import run_etl
+from app.database import reader_uri
+from app.extract_xml import iter_xml_batches, parse_nfe
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+
+
+def nfe_xml(key: str, n_items: int = 1, date_tag: str = "dhEmi", date: str = "2024-01-02T10:00:00-03:00",
+            emit_doc: str = "CNPJ", key_in_id: bool = True, namespace: bool = True) -> bytes:
+    """XML de NF-e mínimo no layout nfeProc/NFe/infNFe, com a chave também no protocolo (protNFe)."""
+    items = "".join(
+        f'<det nItem="{i}"><prod><xProd>Produto {i}</xProd><NCM>48025610</NCM><CFOP>5102</CFOP>'
+        f'<qCom>{i}.0000</qCom><uCom>UN</uCom><vUnCom>2.50</vUnCom><vProd>{2.5 * i:.2f}</vProd></prod></det>'
+        for i in range(1, n_items + 1)
+    )
+    xmlns = f' xmlns="{NFE_NS}"' if namespace else ""
+    id_attr = f' Id="NFe{key}"' if key_in_id else ""
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc{xmlns} versao="4.00"><NFe><infNFe{id_attr} versao="4.00">'
+        f"<ide><mod>55</mod><serie>1</serie><nNF>{int(key[-9:])}</nNF><natOp>VENDA</natOp>"
+        f"<{date_tag}>{date}</{date_tag}><idDest>1</idDest><indFinal>1</indFinal><indPres>1</indPres></ide>"
+        f"<emit><{emit_doc}>12345678000199</{emit_doc}><xNome>Fornecedor</xNome><IE>123</IE>"
+        f"<enderEmit><xMun>São Paulo</xMun><UF>SP</UF></enderEmit></emit>"
+        f"<dest><CNPJ>98765432000188</CNPJ><xNome>Cliente</xNome><enderDest><UF>RJ</UF></enderDest>"
+        f"<indIEDest>9</indIEDest></dest>{items}<total><ICMSTot><vNF>100.00</vNF></ICMSTot></total>"
+        f"</infNFe></NFe><protNFe><infProt><chNFe>{key}</chNFe></infProt></protNFe></nfeProc>"
+    ).encode("utf-8")
+
+
+EVENT_XML = (
+    f'<procEventoNFe xmlns="{NFE_NS}"><evento><infEvento><chNFe>{"9" * 44}</chNFe>'
+    f"<tpEvento>110111</tpEvento></infEvento></evento></procEventoNFe>"
+).encode("utf-8")
+
+
+def key(n: int) -> str:
+    return f"35240112345678000199550010000000{n:012d}"
+
+
+def write_zip(path, members: dict):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return path
+
+
+def test_run_xml_pipeline_keeps_batches_of_notes_without_items(tmp_path, monkeypatch):
+    # Lote 1: notas com itens; lote 2: notas sem <det>. Antes, o lote 2 fazia o ZIP inteiro falhar.
+    members = {f"nfe_{n:02d}.xml": nfe_xml(key(n), n_items=2 if n <= 10 else 0) for n in range(1, 21)}
+    zip_path = write_zip(tmp_path / "notas.zip", members)
+    db_path = tmp_path / "notas.db"
+    workers_used = []
+
+    def small_batches(file_path, workers):
+        workers_used.append(workers)
+        return iter_xml_batches(file_path, files_per_batch=10, workers=workers)
+
+    monkeypatch.setattr(run_etl, "iter_xml_batches", small_batches)
+
+    assert run_etl.run_xml_pipeline(zip_path, db_path, xml_workers=1)
+    assert workers_used == [1]  # O número de processos de leitura vem de quem chama
+
+    with sqlite3.connect(reader_uri(db_path), uri=True) as conn:
+        notes = conn.execute("SELECT COUNT(DISTINCT chave_de_acesso) FROM notas_fiscais").fetchone()[0]
+        without_items = conn.execute("SELECT COUNT(*) FROM notas_fiscais WHERE quantidade IS NULL").fetchone()[0]
+        quantity_type = conn.execute("SELECT typeof(quantidade) FROM notas_fiscais WHERE quantidade IS NOT NULL"
+                                     ).fetchone()[0]
+    assert notes == 20
+    assert without_items == 10
+    assert quantity_type == "real"
+
+
+@pytest.mark.parametrize("namespace", [True, False])
+def test_parse_nfe_reads_header_and_items_with_or_without_namespace(namespace):
+    cabecalho, itens = parse_nfe(io.BytesIO(nfe_xml(key(1), n_items=2, namespace=namespace)))
+
+    assert cabecalho["CHAVE DE ACESSO"] == key(1)
+    assert cabecalho["NÚMERO"] == 1
+    assert cabecalho["CPF/CNPJ Emitente"] == "12345678000199"
+    assert cabecalho["UF EMITENTE"] == "SP"
+    assert cabecalho["UF DESTINATÁRIO"] == "RJ"
+    assert cabecalho["VALOR NOTA FISCAL"] == 100.0
+    assert [(i["NÚMERO PRODUTO"], i["QUANTIDADE"], i["VALOR TOTAL"]) for i in itens] == [(1, 1.0, 2.5), (2, 2.0, 5.0)]
+    assert all(i["CHAVE DE ACESSO"] == key(1) for i in itens)
+
+
+@pytest.mark.parametrize("date_tag, date, expected", [
+    ("dhEmi", "2024-01-02T10:00:00-03:00", "2024-01-02 10:00:00"),  # Hora local, sem o fuso
+    ("dEmi", "2024-01-02", "2024-01-02 00:00:00"),  # Layout anterior à versão 3.10
+])
+def test_parse_nfe_normalizes_emission_date_to_csv_format(date_tag, date, expected):
+    cabecalho, _ = parse_nfe(io.BytesIO(nfe_xml(key(1), date_tag=date_tag, date=date)))
+    assert cabecalho["DATA EMISSÃO"] == expected
+
+
+def test_parse_nfe_accepts_cpf_issuer():
+    cabecalho, _ = parse_nfe(io.BytesIO(nfe_xml(key(1), emit_doc="CPF")))
+    assert cabecalho["CPF/CNPJ Emitente"] == "12345678000199"
+
+
+def test_parse_nfe_falls_back_to_protocol_key():
+    cabecalho, itens = parse_nfe(io.BytesIO(nfe_xml(key(7), key_in_id=False)))
+    assert cabecalho["CHAVE DE ACESSO"] == key(7)
+    assert itens[0]["CHAVE DE ACESSO"] == key(7)
+
+
+def test_parse_nfe_returns_none_for_event_xml():
+    assert parse_nfe(io.BytesIO(EVENT_XML)) == (None, [])
+
+
+def test_iter_xml_batches_skips_events_and_corrupt_files(tmp_path):
+    zip_path = write_zip(tmp_path / "notas.zip", {
+        "nfe_1.xml": nfe_xml(key(1)),
+        "evento.xml": EVENT_XML,
+        "corrompido.xml": b"<nfeProc><NFe>",
+        "leia-me.txt": b"ignorado",
+    })
+    batches = list(iter_xml_batches(zip_path, files_per_batch=10, workers=1))
+
+    assert len(batches) == 1
+    assert batches[0].cabecalho["CHAVE DE ACESSO"].tolist() == [key(1)]
+
+
+def test_iter_xml_batches_keeps_archive_order_with_parallel_workers(tmp_path):
+    members = {f"nfe/{n:03d}.xml": nfe_xml(key(n), n_items=n % 3) for n in range(1, 26)}
+    zip_path = write_zip(tmp_path / "notas.zip", members)
+
+    batches = list(iter_xml_batches(zip_path, files_per_batch=4, workers=3))
+
+    assert [len(b.cabecalho) for b in batches] == [4, 4, 4, 4, 4, 4, 1]
+    keys = [k for b in batches for k in b.cabecalho["CHAVE DE ACESSO"]]
+    assert keys == [key(n) for n in range(1, 26)]
+    assert sum(len(b.itens) for b in batches) == sum(n % 3 for n in range(1, 26))
+    assert batches[0].itens.dtypes["QUANTIDADE"] == "float64"
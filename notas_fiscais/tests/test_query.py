@@ -0,0 +1,20 @@
+import pytest
+from app.database import ShadowLoad
+from app.query import build_database
+from test_database import _frame
+
+
+@pytest.mark.parametrize("folder", ["dados #1", "dados ?x=1", "dados %20 100%"])
+def test_build_database_reads_database_in_folder_with_uri_characters(tmp_path, folder):
+    db_path = tmp_path / folder / "notas.db"
+    db_path.parent.mkdir()
+    with ShadowLoad(db_path) as load:
+        load.append(_frame(3))
+        load.publish()
+
+    db = build_database(db_path)
+    try:
+        assert db.get_usable_table_names() == ["notas_fiscais"]
+        assert db.run("SELECT COUNT(*) FROM notas_fiscais") == "[(3,)]"
+    finally:
+        db._engine.dispose()
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from app.transform import combine_data, join_on_key
+
+# Chaves com espaços, valores ausentes de tipos diferentes e textos iguais à representação dos ausentes:
+# astype(str) distingue None ("None"), NaN ("nan") e pd.NA ("<NA>")
+TEXT_KEYS = [" a", "a", "b ", "c", None, np.nan, pd.NA, "nan", "None", " None", "x"]
+NUMERIC_KEYS = [1.0, 2.0, np.nan, 3.5]
+
+
+def merge_join(left: pd.DataFrame, right: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Junção anterior do combine_data: chaves com astype(str).str.strip() e pd.merge."""
+    left, right = left.copy(), right.copy()
+    left[key] = left[key].astype(str).str.strip()
+    right[key] = right[key].astype(str).str.strip()
+    return pd.merge(left, right, on=key, how="left", suffixes=("_cab", "_item"))
+
+
+def _frames(seed: int, pool: list, dtype, empty_right: bool = False):
+    rng = np.random.default_rng(seed)
+    n_left, n_right = rng.integers(1, 30), rng.integers(1, 60)
+    left = pd.DataFrame({
+        "k": pd.Series([pool[i] for i in rng.integers(0, len(pool), n_left)], dtype=dtype),
+        "v": rng.integers(0, 9, n_left),
+        "d": pd.Timestamp("2024-01-01"),
+    })
+    right = pd.DataFrame({
+        "k": pd.Series([pool[i] for i in rng.integers(0, len(pool), n_right)], dtype=dtype),
+        "v": rng.integers(0, 9, n_right),
+        "f": rng.random(n_right),
+        "b": rng.random(n_right) > 0.5,
+        "c": pd.Categorical(rng.choice(["u", "w"], n_right)),
+    })
+    return left, right.iloc[:0] if empty_right else right
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("pool, dtype, empty_right", [
+    (TEXT_KEYS, object, False),
+    (TEXT_KEYS, object, True),
+    (list(range(8)), None, False),
+    (NUMERIC_KEYS, None, False),
+])
+def test_join_on_key_matches_merge_on_normalized_keys(seed, pool, dtype, empty_right):
+    left, right = _frames(seed, pool, dtype, empty_right)
+    assert_frame_equal(join_on_key(left, right, "k"), merge_join(left, right, "k"))
+
+
+def test_missing_keys_of_different_types_are_not_joined_together():
+    left = pd.DataFrame({"k": pd.Series([None, np.nan], dtype=object), "a": [1, 2]})
+    right = pd.DataFrame({"k": pd.Series([None, "nan"], dtype=object), "b": [3, 4]})
+
+    result = join_on_key(left, right, "k")
+
+    assert result[["k", "a", "b"]].values.tolist() == [["None", 1, 3], ["nan", 2, 4]]
+
+
+def test_combine_data_keeps_notes_without_items_and_does_not_change_inputs():
+    cabecalho = pd.DataFrame({"CHAVE DE ACESSO": [" 1", "2", "3"], "VALOR NOTA FISCAL": [10.0, 20.0, 30.0]})
+    itens = pd.DataFrame({"CHAVE DE ACESSO": ["1", "1", "2"], "QUANTIDADE": ["1", "x", "3"]})
+    cabecalho_before, itens_before = cabecalho.copy(), itens.copy()
+
+    result = combine_data(cabecalho, itens)
+
+    assert result.status == "success"
+    df = result.combined_df
+    assert df["chave_de_acesso"].tolist() == ["1", "1", "2", "3"]
+    assert df["quantidade"].tolist()[:3] == [1.0, 0.0, 3.0]
+    assert np.isnan(df["quantidade"].iloc[3])
+    assert_frame_equal(cabecalho, cabecalho_before)
+    assert_frame_equal(itens, itens_before)
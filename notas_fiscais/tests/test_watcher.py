@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from app import watcher as watcher_module
+from app.watcher import INVALID_AFTER_SECONDS, IngestFile, IngestionWatcher, IngestState
+
+# O ETL real é substituído por uma função que registra as chamadas; o pool de processos por um de threads,
+# para que o teste não dependa de fork nem de banco. Arquivos com "falha" no nome fazem o ETL falhar.
+calls = []
+xml_workers_used = []
+release = threading.Event()
+
+
+def fake_etl(file_name, dataset, xml_workers):
+    calls.append((file_name, dataset))
+    xml_workers_used.append(xml_workers)
+    release.wait(timeout=5)
+    return "falha" not in file_name
+
+
+@pytest.fixture
+def input_dir(tmp_path, monkeypatch):
+    path = tmp_path / "input"
+    path.mkdir()
+    monkeypatch.setattr(watcher_module, "run_etl_pipeline", fake_etl)
+    monkeypatch.setattr(watcher_module, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(watcher_module, "INGEST_DONE_DIR", path / "_done")
+    monkeypatch.setattr(watcher_module, "INGEST_FAILED_DIR", path / "_failed")
+    calls.clear()
+    xml_workers_used.clear()
+    release.set()
+    return path
+
+
+@pytest.fixture
+def watcher(input_dir, tmp_path):
+    service = IngestionWatcher(workers=2, poll_interval=0, state_path=tmp_path / "state.db")
+    service.input_dir = input_dir
+    service._restart_executor()
+    yield service
+    release.set()
+    service.executor.shutdown(wait=True)
+    service.state.close()
+
+
+def _write_zip(path, content=b"a;b\n1;2\n"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("cabecalho.csv", content)
+
+
+def _wait_running(watcher):
+    for future in list(watcher._running):
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+
+
+def test_file_is_processed_after_two_stable_scans_and_moved_to_done(watcher, input_dir):
+    _write_zip(input_dir / "notas.zip")
+
+    assert watcher.poll() == 1  # Primeira varredura: ainda pode estar sendo gravado
+    assert calls == []
+    watcher.poll()
+    assert calls == [("notas.zip", None)]
+    _wait_running(watcher)
+    watcher.poll()
+
+    assert (input_dir / "_done" / "notas.zip").exists()
+    assert not (input_dir / "notas.zip").exists()
+    file = IngestFile("notas.zip", None, *_stat((input_dir / "_done" / "notas.zip")))
+    assert watcher.state.status(file) == "done"
+
+
+def test_failed_etl_moves_file_to_failed(watcher, input_dir, tmp_path):
+    _write_zip(input_dir / "cliente" / "falha.zip")
+    watcher.run(until_idle=True)
+
+    assert calls == [("cliente/falha.zip", "cliente")]
+    assert (input_dir / "_failed" / "cliente" / "falha.zip").exists()
+    state = IngestState(tmp_path / "state.db")  # run() fecha o estado ao terminar
+    status, error = state.conn.execute("SELECT status, error FROM ingest_files").fetchone()
+    state.close()
+    assert status == "failed" and error
+
+
+def test_hidden_and_non_zip_files_are_ignored(watcher, input_dir):
+    _write_zip(input_dir / ".gravando.zip")
+    (input_dir / "leia-me.txt").write_text("x")
+    assert watcher.poll() == 0
+    watcher.poll()
+    assert calls == []
+
+
+def test_stale_invalid_zip_goes_to_failed_without_etl(watcher, input_dir):
+    path = input_dir / "quebrado.zip"
+    path.write_bytes(b"nao e um zip")
+    old = time.time() - INVALID_AFTER_SECONDS - 10
+    os.utime(path, (old, old))
+
+    watcher.poll()
+    watcher.poll()
+
+    assert calls == []
+    assert (input_dir / "_failed" / "quebrado.zip").exists()
+
+
+def test_files_of_same_dataset_run_one_at_a_time(watcher, input_dir):
+    release.clear()
+    for name in ("a1.zip", "a2.zip"):
+        _write_zip(input_dir / "a" / name)
+    _write_zip(input_dir / "b" / "b1.zip")
+    watcher.poll()
+    watcher.poll()
+
+    running = sorted(file.name for file, *_ in watcher._running.values())
+    assert running == ["a/a1.zip", "b/b1.zip"]  # a2 espera a carga de a1 terminar
+
+    release.set()
+    watcher.run(until_idle=True)
+    assert sorted(p.name for p in (input_dir / "_done").rglob("*.zip")) == ["a1.zip", "a2.zip", "b1.zip"]
+    assert sorted(calls) == [("a/a1.zip", "a"), ("a/a2.zip", "a"), ("b/b1.zip", "b")]
+
+
+def test_file_already_done_before_restart_is_moved_without_reprocessing(input_dir, tmp_path):
+    path = input_dir / "notas.zip"
+    _write_zip(path)
+    state = IngestState(tmp_path / "state.db")
+    state.mark(IngestFile("notas.zip", None, *_stat(path)), "done")
+    state.close()
+
+    service = IngestionWatcher(workers=1, poll_interval=0, state_path=tmp_path / "state.db")
+    service.input_dir = input_dir
+    service.run(until_idle=True)
+
+    assert calls == []
+    assert (input_dir / "_done" / "notas.zip").exists()
+
+
+def crashing_etl(file_name, dataset, xml_workers):
+    """ETL executado em um processo real: arquivos com "crash" no nome encerram o processo."""
+    if "crash" in file_name:
+        time.sleep(0.2)
+        os._exit(1)
+    time.sleep(1)  # Ainda em andamento quando o outro processo morre
+    return True
+
+
+def test_crash_fails_only_the_file_that_crashed_with_real_process_pool(input_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher_module, "ProcessPoolExecutor", ProcessPoolExecutor)
+    monkeypatch.setattr(watcher_module, "run_etl_pipeline", crashing_etl)
+    _write_zip(input_dir / "a" / "crash.zip")
+    _write_zip(input_dir / "b" / "good.zip")
+
+    service = IngestionWatcher(workers=2, poll_interval=0.05, state_path=tmp_path / "state.db")
+    service.input_dir = input_dir
+    service.run(until_idle=True)
+
+    assert (input_dir / "_done" / "b" / "good.zip").exists()
+    assert (input_dir / "_failed" / "a" / "crash.zip").exists()
+    state = IngestState(tmp_path / "state.db")
+    statuses = dict(state.conn.execute("SELECT name, status FROM ingest_files").fetchall())
+    state.close()
+    assert statuses == {"a/crash.zip": "failed", "b/good.zip": "done"}
+
+
+def test_cancelled_future_is_submitted_again(watcher, input_dir):
+    path = input_dir / "notas.zip"
+    _write_zip(path)
+    cancelled = Future()
+    cancelled.cancel()
+    watcher._running[cancelled] = (IngestFile("notas.zip", None, *_stat(path)), None, watcher.executor)
+
+    watcher.run(until_idle=True)
+
+    assert calls == [("notas.zip", None)]
+    assert (input_dir / "_done" / "notas.zip").exists()
+
+
+def test_broken_future_from_old_pool_does_not_restart_current_pool(watcher, input_dir):
+    path = input_dir / "notas.zip"
+    _write_zip(path)
+    broken = Future()
+    broken.set_exception(BrokenProcessPool("pool antigo"))
+    watcher._running[broken] = (IngestFile("notas.zip", None, *_stat(path)), None, object())
+    executor = watcher.executor
+
+    watcher.poll()
+
+    assert watcher.executor is executor
+    assert not (input_dir / "_failed" / "notas.zip").exists()
+    watcher.poll()
+    assert calls == [("notas.zip", None)]  # Reprocessado sozinho no pool atual
+
+
+@pytest.mark.parametrize("xml_workers, watch_workers, expected", [(8, 4, 2), (8, 3, 2), (2, 4, 1)])
+def test_xml_workers_are_split_between_concurrent_loads(input_dir, tmp_path, monkeypatch,
+                                                       xml_workers, watch_workers, expected):
+    monkeypatch.setattr(watcher_module, "XML_WORKERS", xml_workers)
+    _write_zip(input_dir / "notas.zip")
+
+    service = IngestionWatcher(workers=watch_workers, poll_interval=0, state_path=tmp_path / "state.db")
+    service.input_dir = input_dir
+    service.run(until_idle=True)
+
+    assert xml_workers_used == [expected]
+
+
+def _stat(path):
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns